@@ -1,15 +1,35 @@
-from flask import Flask, jsonify, request, render_template, send_from_directory
+from flask import Flask, g, jsonify, request, render_template, send_from_directory
 from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 from flask_cors import CORS
+from sqlalchemy.exc import IntegrityError
 from config import Config
-from models import db, User, Car, Booking, Message
-from datetime import datetime
+from models import db, User, Car, Booking, BookingSlot, Message, Payment, ACTIVE_BOOKING_STATUSES
+from datetime import datetime, date, timedelta
 from cop_passwordrecovery import PasswordRecoveryChain
 from singleton_userauthandencrypt import SessionManager
 from observer_bookingnotifications import booking_observer
 from builder_carlisting import CarBuilder
+from fts_carsearch import car_match_subquery
+from pagination_keyset import paginate, paginate_union, parse_limit
+from interval_availability import availability_index
+import ledger_payments
+import slot_bookingreservations # registers the booking_slot flush hook that stops double bookings
+from cache_carsearch import search_cache
+from prefix_locationsuggest import location_index
+from stream_jsonresponses import wants_stream, stream_rows, stream_csv
+from projection_rows import CAR_COLUMNS, BOOKING_COLUMNS, BOOKING_FORMATTERS, pick_columns, row_serializer
+from bulk_carimport import import_cars
+from reconcile_ledgerbalances import reconcile_balances
+from sweeper_pendingbookings import booking_sweeper
+from outbox_bookingevents import outbox_dispatcher
+from pubsub_eventstream import event_hub
+from idempotency_requestreplay import idempotent, replay_cache
+from pool_passwordhashing import password_hasher, HashPoolBusy
+from etag_conditional import conditional_on, catalogue_watermark, my_bookings_watermark, user_info_watermark, inbox_watermark
+import io
 import os
+import click
 
 app = Flask(__name__)
 app.config.from_object(Config)
@@ -19,6 +39,46 @@ CORS(app, supports_credentials=True)
 db.init_app(app)
 migrate = Migrate(app, db)
 jwt = JWTManager(app)
+search_cache.configure(app.config["SEARCH_CACHE_SIZE"], app.config["SEARCH_CACHE_TTL"])
+event_hub.configure(app.config["STREAM_QUEUE_SIZE"], app.config["STREAM_HEARTBEAT"])
+replay_cache.configure(app.config["IDEMPOTENCY_CACHE_SIZE"])
+availability_index.configure(app.config["AVAILABILITY_TTL"])
+password_hasher.configure(
+    app.config["PASSWORD_HASH_METHOD"], app.config["PASSWORD_HASH_WORKERS"],
+    app.config["PASSWORD_HASH_QUEUE"], app.config["PASSWORD_HASH_TIMEOUT"]
+)
+
+@app.before_request # the first request starts them, so CLI commands and the reloader's watcher process, which never serve, don't
+def start_background_workers():
+    if app.config["BACKGROUND_WORKERS"]:
+        booking_sweeper.start(app)
+        outbox_dispatcher.start(app)
+
+# -------------- Helpers -----#
+def parse_date_range(start_value, end_value, max_days=None): # Parses a YYYY-MM-DD start/end pair, raising ValueError with the message for the client
+    try:
+        start_date = datetime.strptime(start_value, "%Y-%m-%d").date()
+        end_date = datetime.strptime(end_value, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        raise ValueError("Invalid date format. Use YYYY-MM-DD")
+    if start_date >= end_date:
+        raise ValueError("Invalid date range")
+    if max_days is not None and (end_date - start_date).days > max_days:
+        raise ValueError(f"Date range too long, at most {max_days} days")
+    return start_date, end_date
+
+def booking_overlaps(start_date, end_date): # Bookings that still hold their car and touch the given dates
+    return db.and_(
+        Booking.start_date <= end_date,
+        Booking.end_date >= start_date,
+        Booking.status.in_(ACTIVE_BOOKING_STATUSES)
+    )
+
+@app.errorhandler(HashPoolBusy) # the password hashing pool is full, cheaper to ask the client to come back than to queue
+def hash_pool_busy(e):
+    response = jsonify({"error": "Too many logins right now, try again shortly"})
+    response.headers["Retry-After"] = "1"
+    return response, 503
 
 # -------------- Authentication-----#
 @app.route("/register", methods=["POST"]) # Registers a new user, by creating username, email, security questions, and password fields
@@ -53,6 +113,9 @@ def register():
         db.session.add(user)
         db.session.commit()
         return jsonify({"message": "User registered successfully!"}), 201
+    except HashPoolBusy:
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 400
@@ -65,6 +128,12 @@ def login(): #logs in the user via an email and password, as well as returning a
 
     user = User.query.filter_by(email=email).first()
     if user and user.check_password(password):
+        if user.password_needs_rehash(): # the password is at hand only now, so this is where old hashes get upgraded
+            try:
+                user.set_password(password)
+                db.session.commit()
+            except HashPoolBusy: # the login already succeeded, the upgrade can wait for the next one
+                db.session.rollback()
         
         access_token = create_access_token(identity=str(user.id))
         session_manager = SessionManager()
@@ -79,6 +148,7 @@ def login(): #logs in the user via an email and password, as well as returning a
 # -All user endpoints- #
 @app.route('/user/info')
 @jwt_required() #Shows basic user infor, such as the id, username and email
+@conditional_on(user_info_watermark)
 def get_user_info():
     user_id = get_jwt_identity()
     user = User.query.get(user_id)
@@ -134,22 +204,190 @@ def create_car():
         db.session.rollback()
         return jsonify({"error": str(e)}), 400
 
-@app.route("/cars", methods=["GET"])#Shows all cars that are filtered by location, by default all listings are shown
+@app.route("/cars/bulk", methods=["POST"])
+@jwt_required() # Imports many listings at once from an NDJSON or CSV body, answering with a per row error report
+def bulk_create_cars():
+    current_user_id = int(get_jwt_identity())
+    fmt = request.args.get("format") or ("csv" if request.mimetype == "text/csv" else "ndjson")
+    if fmt not in ("csv", "ndjson"):
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+    try:
+        batch_size = parse_limit(request.args.get("batch_size"), app.config["BULK_IMPORT_BATCH_SIZE"], app.config["BULK_IMPORT_MAX_BATCH_SIZE"])
+    except ValueError:
+        return jsonify({"error": "Invalid batch_size"}), 400
+
+    lines = io.TextIOWrapper(io.BufferedReader(request.stream), encoding="utf-8", newline="") # read as it arrives, the body is never held whole
+    try:
+        report = import_cars(lines, fmt, current_user_id, batch_size, app.config["BULK_IMPORT_MAX_ERRORS"])
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+    return jsonify(report), 201 if report["inserted"] else 400
+
+@app.cli.command("import-cars") # flask import-cars listings.csv --owner-id 3
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--owner-id", type=int, required=True, help="User that will own every imported car")
+@click.option("--format", "fmt", type=click.Choice(["csv", "ndjson"]), help="Defaults to csv for .csv files, ndjson otherwise")
+@click.option("--batch-size", type=int, default=None, help="Rows per insert batch")
+def import_cars_command(path, owner_id, fmt, batch_size):
+    if not db.session.get(User, owner_id):
+        raise click.ClickException(f"No user with id {owner_id}")
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "ndjson")
+    with open(path, encoding="utf-8", newline="") as lines:
+        report = import_cars(lines, fmt, owner_id, batch_size or app.config["BULK_IMPORT_BATCH_SIZE"], app.config["BULK_IMPORT_MAX_ERRORS"])
+    for error in report["errors"]:
+        click.echo(f"row {error['row']}: {error['error']}", err=True)
+    click.echo(f"Imported {report['inserted']} cars, {report['failed']} rows rejected")
+
+CAR_SORTS = { # ?sort= -> (keyset columns ending in the id, highest first)
+    "price": ([Car.price_per_day, Car.id], False),
+    "year": ([Car.year, Car.id], True),
+    "newest": ([Car.id], True)
+}
+
+@app.route("/cars", methods=["GET"])#Shows cars filtered by location, a ranked make/model/location search (q), free dates (start_date, end_date), make and price/year ranges, sorted (sort), a page at a time (limit, cursor) and trimmed to the requested fields
+@conditional_on(catalogue_watermark)
 def get_cars():
+    streaming = wants_stream() # a full export, streamed row by row and never cached
+    if not streaming:
+        cache_key = search_cache.key_for(request.args, case_insensitive=("location", "q", "make", "sort"))
+        cached_body = search_cache.get(cache_key, g.watermark) # catalogue_watermark, with the booking columns for date searches
+        if cached_body is not None:
+            return app.response_class(cached_body, mimetype="application/json")
+
     location = request.args.get("location", "").strip()
+    search_text = request.args.get("q", "").strip()
+    start_value = request.args.get("start_date", "").strip()
+    end_value = request.args.get("end_date", "").strip()
+    make = request.args.get("make", "").strip()
+    sort = request.args.get("sort", "").strip().lower()
+    cursor = request.args.get("cursor", "").strip()
+
+    try:
+        limit = parse_limit(request.args.get("limit"), app.config["CARS_PAGE_SIZE"], app.config["MAX_PAGE_SIZE"])
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+
+    if sort and sort not in CAR_SORTS:
+        return jsonify({"error": f"sort must be one of {', '.join(CAR_SORTS)}"}), 400
+
+    try:
+        selected = pick_columns(request.args.get("fields"), CAR_COLUMNS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    bounds = {}
+    for name, convert in (("min_price", float), ("max_price", float), ("min_year", int), ("max_year", int)):
+        raw_value = request.args.get(name, "").strip()
+        if raw_value:
+            try:
+                bounds[name] = convert(raw_value)
+            except ValueError:
+                return jsonify({"error": f"Invalid {name}"}), 400
     
-    query = Car.query.filter(Car.available == True)
+    query = db.select(*selected).select_from(Car).where(Car.available == True) # plain rows of just the requested columns
+    key_columns, tag, descending = [Car.id], "id", False
     
     if location:
-        query = query.filter(Car.location.ilike(f"%{location}%"))
+        query = query.where(Car.location.ilike(f"%{location}%"))
+
+    if make: # NOCASE to match the collation of the (available, make, year) index
+        query = query.where(Car.make.collate("NOCASE") == make)
+    if "min_price" in bounds:
+        query = query.where(Car.price_per_day >= bounds["min_price"])
+    if "max_price" in bounds:
+        query = query.where(Car.price_per_day <= bounds["max_price"])
+    if "min_year" in bounds:
+        query = query.where(Car.year >= bounds["min_year"])
+    if "max_year" in bounds:
+        query = query.where(Car.year <= bounds["max_year"])
+
+    if search_text:
+        matches = car_match_subquery(search_text)
+        if matches is not None: # best matches first, through the FTS index instead of scanning car
+            query = query.join(matches, matches.c.car_id == Car.id)
+            key_columns, tag = [matches.c.rank, Car.id], "rank"
+
+    if sort: # an explicit sort wins over relevance
+        key_columns, descending = CAR_SORTS[sort]
+        tag = sort
+
+    if start_value or end_value: # only cars with no holding booking over those dates, as one anti-join on the booking overlap index
+        try:
+            start_date, end_date = parse_date_range(start_value, end_value)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        query = query.where(~db.select(Booking.id).where(
+            Booking.car_id == Car.id,
+            booking_overlaps(start_date, end_date)
+        ).exists())
     
-    cars = query.all()
-    return jsonify([car.to_dict() for car in cars])
+    serialize = row_serializer(selected)
+    if streaming:
+        return stream_rows(query.order_by(*[column.desc() if descending else column for column in key_columns]), serialize)
+
+    try:
+        rows, next_cursor = paginate(query, key_columns, limit, cursor, tag, descending)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    response = jsonify({
+        "cars": [serialize(row) for row in rows],
+        "next_cursor": next_cursor
+    })
+    search_cache.put(cache_key, g.watermark, response.get_data())
+    return response
+
+@app.route("/cache/stats", methods=["GET"]) # Hit/miss/eviction counters for the car search cache, used to size it
+@jwt_required()
+def get_cache_stats():
+    return jsonify(search_cache.stats())
+
+
+@app.route("/locations/suggest", methods=["GET"]) # Location autocomplete with listing counts, answered from memory
+def suggest_locations():
+    prefix = request.args.get("prefix", "").strip()
+    if not prefix:
+        return jsonify({"error": "prefix is required"}), 400
+    try:
+        limit = parse_limit(request.args.get("limit"), 10, 50)
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+    return jsonify({
+        "prefix": prefix,
+        "suggestions": location_index.suggest(prefix, limit)
+    })
+
+@app.route("/cars/<int:car_id>/availability", methods=["GET"]) # Free and booked date ranges for one car, from/to default to the next 30 days
+def get_car_availability(car_id):
+    if not db.session.get(Car, car_id):
+        return jsonify({"error": "Car not found"}), 404
+
+    from_value = request.args.get("from", "").strip()
+    to_value = request.args.get("to", "").strip()
+    if from_value or to_value:
+        try:
+            start_date, end_date = parse_date_range(from_value, to_value, 366)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    else:
+        start_date = date.today()
+        end_date = start_date + timedelta(days=30)
+
+    booked, free = availability_index.calendar(car_id, start_date, end_date)
+    return jsonify({
+        "car_id": car_id,
+        "from": start_date.isoformat(),
+        "to": end_date.isoformat(),
+        "booked": booked,
+        "free": free
+    })
 
 
 # - Booking Endpoints - #
 @app.route("/bookings", methods=["POST"]) #Creates bookings for logged in users, allows to put in start/end dates
 @jwt_required()
+@idempotent # retries carrying the same Idempotency-Key get the first response back
 def create_booking():
     current_user_id = get_jwt_identity()
     data = request.get_json()
@@ -159,31 +397,22 @@ def create_booking():
         return jsonify({"error": "Missing required fields"}), 400
 
     try:
-        start_date = datetime.strptime(data["start_date"], "%Y-%m-%d").date()
-        end_date = datetime.strptime(data["end_date"], "%Y-%m-%d").date()
-        if start_date >= end_date:
-            return jsonify({"error": "Invalid date range"}), 400
-    except ValueError:
-        return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
+        start_date, end_date = parse_date_range(data["start_date"], data["end_date"], app.config["BOOKING_MAX_DAYS"])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     car = Car.query.get(data["car_id"])
     if not car:
         return jsonify({"error": "Car not found"}), 404
 
-    conflicting_bookings = Booking.query.filter(
-        Booking.car_id == data["car_id"],
-        Booking.start_date <= end_date,
-        Booking.end_date >= start_date,
-        Booking.status.in_(["pending", "confirmed"])
-    ).count()
-    
-    if conflicting_bookings > 0:
+    # cheap early answer from the in memory interval list, a busy one is confirmed against booking_slot, which also has the final say on insert
+    if not availability_index.is_free(car.id, start_date, end_date) and availability_index.confirm_busy(car.id, start_date, end_date):
         return jsonify({"error": "Car not available for selected dates"}), 409
 
     try:
         #Creates a new booking
         booking = Booking(
-            car_id=data["car_id"],
+            car_id=car.id,
             user_id=current_user_id,
             start_date=start_date,
             end_date=end_date
@@ -191,69 +420,264 @@ def create_booking():
         db.session.add(booking)
         db.session.flush()
 
-        # Through the observer pattern the notification is made
+        # Through the observer pattern the notification is queued, the outbox workers send it after the commit
         booking_observer.notify(booking, "created")
         db.session.commit()
         return jsonify({
             "message": "Booking created successfully!",
             "booking_id": booking.id
         }), 201
+    except IntegrityError: # a concurrent booking claimed one of these days first
+        db.session.rollback()
+        return jsonify({"error": "Car not available for selected dates"}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
 
 
-@app.route("/mybookings", methods=["GET"]) #Returns all bookings for the user
+def with_car(serialize): # Wraps a booking row serializer to add the joined car_* columns and what the stay costs
+    def serialize_with_car(row):
+        booking = serialize(row)
+        mapping = row._mapping
+        booking["car"] = {key: mapping[f"car_{key}"] for key in CAR_COLUMNS}
+        booking["total_price"] = round((mapping["_end"] - mapping["_start"]).days * mapping["car_price_per_day"], 2)
+        return booking
+    return serialize_with_car
+
+@app.route("/bookings/batch", methods=["POST"]) #Books several cars and/or date ranges at once, all of them or none
 @jwt_required()
+@idempotent # retries carrying the same Idempotency-Key get the first response back
+def create_bookings_batch():
+    current_user_id = get_jwt_identity()
+    data = request.get_json()
+    items = data.get("bookings") if isinstance(data, dict) else data
+
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Expected a non-empty list of bookings"}), 400
+    if len(items) > app.config["BOOKING_BATCH_MAX"]:
+        return jsonify({"error": f"At most {app.config['BOOKING_BATCH_MAX']} bookings per batch"}), 400
+
+    requested, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict) or not all(field in item for field in ["car_id", "start_date", "end_date"]):
+                raise ValueError("Missing required fields")
+            start_date, end_date = parse_date_range(item["start_date"], item["end_date"], app.config["BOOKING_MAX_DAYS"])
+            requested.append((index, int(item["car_id"]), start_date, end_date))
+        except (TypeError, ValueError) as e:
+            errors.append({"index": index, "error": str(e)})
+    if errors:
+        return jsonify({"error": "Invalid bookings", "details": errors}), 400
+
+    car_ids = {car_id for index, car_id, start_date, end_date in requested}
+    cars = {car.id: car for car in Car.query.filter(Car.id.in_(car_ids)).all()} # also lets the notifications find each booking's car without a query
+    missing = [index for index, car_id, start_date, end_date in requested if car_id not in cars]
+    if missing:
+        return jsonify({"error": "Car not found", "indexes": missing}), 404
+
+    conflicts = set()
+    by_car = {}
+    for entry in sorted(requested, key=lambda entry: (entry[1], entry[2])):
+        previous = by_car.get(entry[1])
+        if previous and entry[2] <= previous[3]: # overlaps another range in this same batch
+            conflicts.update((previous[0], entry[0]))
+        if not previous or entry[3] > previous[3]:
+            by_car[entry[1]] = entry
+
+    taken = db.session.execute( # every requested range against existing bookings, in one query on the overlap index
+        db.select(Booking.car_id, Booking.start_date, Booking.end_date).where(
+            Booking.status.in_(ACTIVE_BOOKING_STATUSES),
+            db.or_(*[
+                db.and_(Booking.car_id == car_id, Booking.start_date <= end_date, Booking.end_date >= start_date)
+                for index, car_id, start_date, end_date in requested
+            ])
+        )
+    ).all()
+    for index, car_id, start_date, end_date in requested:
+        if any(row.car_id == car_id and row.start_date <= end_date and row.end_date >= start_date for row in taken):
+            conflicts.add(index)
+    if conflicts:
+        return jsonify({"error": "Car not available for selected dates", "indexes": sorted(conflicts)}), 409
+
+    try:
+        bookings = [
+            Booking(car_id=car_id, user_id=current_user_id, start_date=start_date, end_date=end_date)
+            for index, car_id, start_date, end_date in requested
+        ]
+        db.session.add_all(bookings)
+        db.session.flush()
+
+        booking_observer.notify_many(bookings, "created")
+        db.session.commit()
+        return jsonify({
+            "message": "Bookings created successfully!",
+            "booking_ids": [booking.id for booking in bookings]
+        }), 201
+    except IntegrityError: # a concurrent booking claimed one of these days first
+        db.session.rollback()
+        return jsonify({"error": "Car not available for selected dates"}), 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+
+
+@app.route("/mybookings", methods=["GET"]) #Returns all bookings for the user, optionally trimmed to the requested fields, include=car adds each car and the total price
+@jwt_required()
+@conditional_on(my_bookings_watermark)
 def get_my_bookings():
     current_user_id = get_jwt_identity()
+    include = {name.strip() for name in request.args.get("include", "").split(",") if name.strip()}
+    if include - {"car"}:
+        return jsonify({"error": "include only supports car"}), 400
 
-    user_bookings = Booking.query.filter_by(user_id=current_user_id).all()
+    try:
+        selected = pick_columns(request.args.get("fields"), BOOKING_COLUMNS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    query = db.select(*selected).where(Booking.user_id == current_user_id).order_by(Booking.id)
+    serialize = row_serializer(selected, BOOKING_FORMATTERS)
+    if "car" in include: # cars come from the same query through a join, not one lazy load per booking
+        query = query.join(Car, Booking.car_id == Car.id).add_columns(
+            *[column.label(f"car_{column.key}") for column in CAR_COLUMNS.values()],
+            Booking.start_date.label("_start"), Booking.end_date.label("_end")
+        )
+        serialize = with_car(serialize)
+    if wants_stream():
+        return stream_rows(query, serialize)
+
+    user_bookings = db.session.execute(query).all()
+    return jsonify([serialize(booking) for booking in user_bookings])
 
-    
-    return jsonify([booking.to_dict() for booking in user_bookings])
+
+
+@app.route("/owner/summary", methods=["GET"]) #Per car booking counts, the next bookings, occupancy over the last days (default 30) and revenue, for the logged in owner
+@jwt_required()
+def get_owner_summary():
+    current_user_id = get_jwt_identity()
+    try:
+        days = parse_limit(request.args.get("days"), 30, 366)
+        limit = parse_limit(request.args.get("limit"), 20, app.config["MAX_PAGE_SIZE"])
+    except ValueError:
+        return jsonify({"error": "Invalid days or limit"}), 400
+    today = date.today()
+    window_start = today - timedelta(days=days - 1)
+    fleet = db.select(Car.id).where(Car.owner_id == current_user_id).scalar_subquery()
+
+    # One grouped query per measure, each one an index range scan over the owner's cars, joined back onto the fleet
+    booking_stats = (
+        db.select(
+            Booking.car_id,
+            db.func.count(Booking.id).label("bookings"),
+            db.func.count(Booking.id).filter(Booking.start_date >= today).label("upcoming"),
+            db.func.min(Booking.start_date).filter(Booking.start_date >= today).label("next_start")
+        )
+        .where(Booking.car_id.in_(fleet), Booking.status.in_(ACTIVE_BOOKING_STATUSES))
+        .group_by(Booking.car_id)
+        .subquery()
+    )
+    occupied = ( # booking_slot already holds one row per car per held day
+        db.select(BookingSlot.car_id, db.func.count().label("days"))
+        .where(BookingSlot.car_id.in_(fleet), BookingSlot.day.between(window_start, today))
+        .group_by(BookingSlot.car_id)
+        .subquery()
+    )
+    revenue = (
+        db.select(Booking.car_id, db.func.sum(Payment.amount_cents).label("amount_cents"), db.func.count(Payment.id).label("payments"))
+        .join(Payment, Payment.booking_id == Booking.id)
+        .where(Booking.car_id.in_(fleet), Payment.receiver_id == current_user_id)
+        .group_by(Booking.car_id)
+        .subquery()
+    )
+    rows = db.session.execute(
+        db.select(
+            Car.id, Car.make, Car.model, Car.location,
+            db.func.coalesce(booking_stats.c.bookings, 0).label("bookings"),
+            db.func.coalesce(booking_stats.c.upcoming, 0).label("upcoming"),
+            booking_stats.c.next_start,
+            db.func.coalesce(occupied.c.days, 0).label("occupied_days"),
+            db.func.coalesce(revenue.c.amount_cents, 0).label("revenue_cents"),
+            db.func.coalesce(revenue.c.payments, 0).label("payments")
+        )
+        .outerjoin(booking_stats, booking_stats.c.car_id == Car.id)
+        .outerjoin(occupied, occupied.c.car_id == Car.id)
+        .outerjoin(revenue, revenue.c.car_id == Car.id)
+        .where(Car.owner_id == current_user_id)
+        .order_by(Car.id)
+    ).all()
+
+    upcoming = db.session.execute(
+        db.select(Booking.id, Booking.car_id, Booking.start_date, Booking.end_date, Booking.status, User.username.label("renter"))
+        .join(User, Booking.user_id == User.id)
+        .where(Booking.car_id.in_(fleet), Booking.status.in_(ACTIVE_BOOKING_STATUSES), Booking.start_date >= today)
+        .order_by(Booking.start_date, Booking.id)
+        .limit(limit)
+    ).all()
+
+    cars = [{
+        "car_id": row.id,
+        "make": row.make,
+        "model": row.model,
+        "location": row.location,
+        "bookings": row.bookings,
+        "upcoming": row.upcoming,
+        "next_start": row.next_start.isoformat() if row.next_start else None,
+        "occupied_days": row.occupied_days,
+        "occupancy": round(row.occupied_days / days, 4),
+        "revenue": row.revenue_cents / 100,
+        "payments": row.payments
+    } for row in rows]
+    occupied_total = sum(car["occupied_days"] for car in cars)
+    return jsonify({
+        "from": window_start.isoformat(),
+        "to": today.isoformat(),
+        "totals": {
+            "cars": len(cars),
+            "bookings": sum(car["bookings"] for car in cars),
+            "upcoming": sum(car["upcoming"] for car in cars),
+            "occupancy": round(occupied_total / (days * len(cars)), 4) if cars else 0,
+            "revenue": sum(row.revenue_cents for row in rows) / 100
+        },
+        "cars": cars,
+        "upcoming": [{
+            "booking_id": booking.id,
+            "car_id": booking.car_id,
+            "renter": booking.renter,
+            "start_date": booking.start_date.isoformat(),
+            "end_date": booking.end_date.isoformat(),
+            "status": booking.status
+        } for booking in upcoming]
+    })
 
 
 
 # ---- Payment Endpoints --- #
-class PaymentProxy: #Handles the payment logic, such as the balances and payment info into the database
+class PaymentProxy: #Handles the payment logic, the balances move through the ledger and the payment info goes into the database
     def __init__(self):
         self._real_payment_system = None
 
-    def process_payment(self, sender_id, receiver_id, amount, booking_id):
-        sender = User.query.get(sender_id)
-        receiver = User.query.get(receiver_id)
-        
-        if not sender or not receiver:
-            return False, "Invalid users"
-        if sender.balance < amount:
-            return False, "Insufficient funds"
-        
-        sender.balance -= amount
-        receiver.balance += amount
-        
-        payment = Payment(
-            sender_id=sender_id,
-            receiver_id=receiver_id,
-            amount=amount,
-            booking_id=booking_id
-        )
-        db.session.add(payment)
-        self._create_notifications(sender, receiver, booking_id, amount)
+    def process_payment(self, sender_id, receiver_id, amount_cents, booking_id):
+        try:
+            ledger_payments.transfer(sender_id, receiver_id, amount_cents, booking_id)
+        except ledger_payments.LedgerError as e:
+            return False, str(e)
+        self._create_notifications(sender_id, receiver_id, booking_id, amount_cents)
         return True, "Payment successful"
     
-    def _create_notifications(self, sender, receiver, booking_id, amount):
+    def _create_notifications(self, sender_id, receiver_id, booking_id, amount_cents):
+        amount = ledger_payments.format_cents(amount_cents)
         notifications = [
             Message(
-                sender_id=sender.id,
-                receiver_id=receiver.id,
-                content=f"Payment of ${amount:.2f} for booking #{booking_id} received"
+                sender_id=sender_id,
+                receiver_id=receiver_id,
+                content=f"Payment of {amount} for booking #{booking_id} received"
             ),
             Message(
-                sender_id=receiver.id,
-                receiver_id=sender.id,
-                content=f"Payment of ${amount:.2f} for booking #{booking_id} sent"
+                sender_id=receiver_id,
+                receiver_id=sender_id,
+                content=f"Payment of {amount} for booking #{booking_id} sent"
             )
         ]
         db.session.add_all(notifications)
@@ -262,33 +686,129 @@ payment_proxy = PaymentProxy()
 
 @app.route('/bookings/<int:booking_id>/pay', methods=['POST']) #Payments are processed for bookings
 @jwt_required()
+@idempotent # retries carrying the same Idempotency-Key get the first response back
 def make_payment(booking_id):
-    current_user = get_jwt_identity()
+    current_user = int(get_jwt_identity())
     booking = Booking.query.get_or_404(booking_id)
     
     if booking.user_id != current_user:
         return jsonify({"error": "Unauthorized"}), 403
+    if booking.status not in ACTIVE_BOOKING_STATUSES: # an expired or cancelled booking no longer holds the car
+        return jsonify({"error": f"Booking is {booking.status or 'not active'} and can't be paid"}), 409
+    if db.session.scalar(db.select(Payment.id).where(Payment.booking_id == booking_id).limit(1)): # cheap early answer, the unique payment.booking_id has the final say
+        return jsonify({"error": "Booking already paid"}), 409
     
     days = (booking.end_date - booking.start_date).days
-    amount = days * booking.car.price_per_day
+    amount_cents = days * ledger_payments.to_cents(booking.car.price_per_day)
     
-    success, message = payment_proxy.process_payment(
-        current_user,
-        booking.car.owner_id,
-        amount,
-        booking_id
-    )
+    try:
+        success, message = payment_proxy.process_payment(
+            current_user,
+            booking.car.owner_id,
+            amount_cents,
+            booking_id
+        )
+    except IntegrityError: # a concurrent request paid it between the check above and our insert
+        db.session.rollback()
+        return jsonify({"error": "Booking already paid"}), 409
     
     if not success:
+        db.session.rollback() # a failed credit can follow a debit that already ran
         return jsonify({"error": message}), 400
     
+    confirmed = db.session.execute( # conditional, the sweeper may have expired it and freed its days since we read it
+        db.update(Booking)
+        .where(Booking.id == booking_id, Booking.status.in_(ACTIVE_BOOKING_STATUSES))
+        .values(status="confirmed")
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not confirmed:
+        db.session.rollback()
+        return jsonify({"error": "Booking expired before it was paid"}), 409
+    booking.status = "confirmed" # in the payment's transaction, so the sweeper never expires a paid booking
+    booking_observer.notify(booking, "confirmed")
     db.session.commit()
     return jsonify({
         "message": "Payment successful",
-        "new_balance": User.query.get(current_user).balance
+        "new_balance": db.session.get(User, current_user).balance
     })
     
     
+PAYMENT_ROLES = ("all", "sent", "received")
+PAYMENT_FIELDS = (Payment.id, Payment.booking_id, Payment.sender_id, Payment.receiver_id, Payment.amount_cents, Payment.timestamp)
+
+def payment_branches(user_id): # The user's payments filtered by role, from/to (YYYY-MM-DD, inclusive) and booking_id, one where clause per index to walk, raising ValueError with the message for the client
+    role = request.args.get("role", "all").strip().lower()
+    if role not in PAYMENT_ROLES:
+        raise ValueError(f"role must be one of {', '.join(PAYMENT_ROLES)}")
+    filters = []
+    from_value = request.args.get("from", "").strip()
+    to_value = request.args.get("to", "").strip()
+    try:
+        if from_value:
+            filters.append(Payment.timestamp >= datetime.strptime(from_value, "%Y-%m-%d"))
+        if to_value:
+            filters.append(Payment.timestamp < datetime.strptime(to_value, "%Y-%m-%d") + timedelta(days=1))
+    except ValueError:
+        raise ValueError("Invalid date format. Use YYYY-MM-DD")
+    booking_id = request.args.get("booking_id", "").strip()
+    if booking_id:
+        if not booking_id.isdigit():
+            raise ValueError("booking_id must be an integer")
+        filters.append(Payment.booking_id == int(booking_id))
+
+    branches = []
+    if role in ("all", "sent"): # (sender_id, id) index
+        branches.append([Payment.sender_id == user_id, *filters])
+    if role in ("all", "received"): # (receiver_id, id) index, payments to yourself already came from the sent side
+        branches.append([Payment.receiver_id == user_id, *filters] + ([Payment.sender_id != user_id] if role == "all" else []))
+    return branches
+
+def payments_statement(branches): # UNION ALL of one select per branch, never an OR that makes SQLite sort the whole history
+    selects = [db.select(*PAYMENT_FIELDS).where(*conditions) for conditions in branches]
+    merged = (db.union_all(*selects) if len(selects) > 1 else selects[0]).subquery()
+    return db.select(merged)
+
+def payment_dict(p):
+    return {
+        "id": p.id,
+        "booking_id": p.booking_id,
+        "sender_id": p.sender_id,
+        "receiver_id": p.receiver_id,
+        "amount": p.amount_cents / 100,
+        "amount_cents": p.amount_cents,
+        "timestamp": p.timestamp.isoformat()
+    }
+
+PAYMENT_CSV_HEADER = ("id", "timestamp", "booking_id", "sender_id", "receiver_id", "amount")
+
+def payment_csv_row(p):
+    return (p.id, p.timestamp.isoformat(), p.booking_id, p.sender_id, p.receiver_id, ledger_payments.cents_to_decimal_string(p.amount_cents))
+
+@app.route("/payments", methods=["GET"]) # The user's payments newest first, a page (limit, cursor) at a time, filtered by role (all, sent, received), from/to dates and booking_id
+@jwt_required()
+def get_payments():
+    current_user_id = int(get_jwt_identity())
+    cursor = request.args.get("cursor", "").strip()
+    try:
+        limit = parse_limit(request.args.get("limit"), app.config["PAYMENTS_PAGE_SIZE"], app.config["MAX_PAGE_SIZE"])
+        selects = [db.select(*PAYMENT_FIELDS).where(*conditions) for conditions in payment_branches(current_user_id)]
+        rows, next_cursor = paginate_union(selects, Payment.id, limit, cursor, "payments")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"payments": [payment_dict(row) for row in rows], "next_cursor": next_cursor})
+
+@app.route("/payments/export.csv", methods=["GET"]) # Same filters as /payments, every matching row oldest first as CSV, streamed from the cursor
+@jwt_required()
+def export_payments():
+    current_user_id = int(get_jwt_identity())
+    try:
+        query = payments_statement(payment_branches(current_user_id))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return stream_csv(query.order_by(query.selected_columns.id), PAYMENT_CSV_HEADER, payment_csv_row, "payments.csv")
+
+
 # ----- messages -- #
     
 @app.route("/messages", methods=["POST"]) # Sends messages from one account to another
@@ -324,39 +844,191 @@ def send_message():
 
 
 
+@app.route("/stream", methods=["GET"]) # Server-Sent Events with the user's new messages and booking updates, one open connection instead of polling the inbox
+@jwt_required(locations=["headers", "query_string"]) # ?jwt= only here, tokens in URLs end up in logs
+def stream_events():
+    return event_hub.stream(get_jwt_identity())
+
+def received_message_dict(m):
+    return {
+        "id": m.id,
+        "sender_email": m.email,  # Include sender's email
+        "content": m.content,
+        "timestamp": m.timestamp.isoformat()
+    }
+
+def sent_message_dict(m):
+    return {
+        "id": m.id,
+        "receiver_id": m.receiver_id,
+        "content": m.content,
+        "timestamp": m.timestamp.isoformat()
+    }
+
 @app.route("/users/<int:user_id>/messages", methods=["GET"])
-@jwt_required() # Returns messages where the user is the recipient of a message
+@jwt_required() # Returns messages where the user is the recipient, newest first a page (limit) at a time, since_id gives only newer ones oldest first, before_id pages back, ?stream=1 or an NDJSON Accept streams them all oldest first
+@conditional_on(inbox_watermark)
 def get_received_messages(user_id):
     if str(get_jwt_identity()) != str(user_id):
         return jsonify({"error": "Unauthorized"}), 403
-    
-    messages = Message.query.filter_by(receiver_id=user_id).join(
+
+    try:
+        since_id = int(request.args["since_id"]) if request.args.get("since_id") else None
+        before_id = int(request.args["before_id"]) if request.args.get("before_id") else None
+        limit = parse_limit(request.args.get("limit"), app.config["MESSAGES_PAGE_SIZE"], app.config["MAX_PAGE_SIZE"])
+    except ValueError:
+        return jsonify({"error": "since_id, before_id and limit must be integers"}), 400
+
+    query = db.select(Message.id, Message.content, Message.timestamp, User.email).join(
         User, Message.sender_id == User.id
-    ).add_columns(User.email).all()
+    ).where(Message.receiver_id == user_id) # every variant is a range of ix_message_receiver_id_id
+    if since_id is not None:
+        query = query.where(Message.id > since_id)
+    if before_id is not None:
+        query = query.where(Message.id < before_id)
+    if wants_stream():
+        return stream_rows(query.order_by(Message.id), received_message_dict)
 
-    return jsonify([{
-        "id": m.Message.id,
-        "sender_email": m.email,  # Include sender's email
-        "content": m.Message.content,
-        "timestamp": m.Message.timestamp.isoformat()
-    } for m in messages])
+    query = query.order_by(Message.id if since_id is not None else Message.id.desc()).limit(limit)
+    messages = db.session.execute(query).all()
+    return jsonify([received_message_dict(m) for m in messages])
 
 @app.route("/users/<int:user_id>/sent_messages", methods=["GET"])
-@jwt_required() # Messages are returned to the sender
+@jwt_required() # Messages are returned to the sender, ?stream=1 or an NDJSON Accept streams them
 def get_sent_messages(user_id):
     if str(get_jwt_identity()) != str(user_id):
         return jsonify({"error": "Unauthorized"}), 403
 
     # Filter messages where the user is the sender
-    messages = Message.query.filter_by(sender_id=user_id).all()
-    return jsonify([{
+    query = db.select(Message.id, Message.receiver_id, Message.content, Message.timestamp).where(
+        Message.sender_id == user_id
+    ).order_by(Message.id)
+    if wants_stream():
+        return stream_rows(query, sent_message_dict)
+
+    messages = db.session.execute(query).all()
+    return jsonify([sent_message_dict(m) for m in messages])
+
+    
+
+def conversation_dict(c):
+    return {
+        "user_id": c.other_id,
+        "email": c.email,
+        "username": c.username,
+        "last_message": {
+            "id": c.id,
+            "content": c.content,
+            "timestamp": c.timestamp.isoformat(),
+            "from_me": c.from_me
+        },
+        "unread": c.unread
+    }
+
+def thread_message_dict(m):
+    return {
         "id": m.id,
+        "sender_id": m.sender_id,
         "receiver_id": m.receiver_id,
         "content": m.content,
-        "timestamp": m.timestamp.isoformat()
-    } for m in messages])
+        "timestamp": m.timestamp.isoformat(),
+        "read_at": m.read_at.isoformat() if m.read_at else None
+    }
 
-    
+@app.route("/conversations", methods=["GET"]) # One entry per person the user has messaged or heard from, newest conversation first, with the latest message and how many are unread
+@jwt_required()
+def get_conversations():
+    current_user_id = int(get_jwt_identity())
+    cursor = request.args.get("cursor", "").strip()
+    try:
+        limit = parse_limit(request.args.get("limit"), app.config["MESSAGES_PAGE_SIZE"], app.config["MAX_PAGE_SIZE"])
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+
+    # Newest message id per counterpart, each half a grouped max over the (sender_id, receiver_id, id) / (receiver_id, sender_id, id) indexes
+    sent = db.select(Message.receiver_id.label("other_id"), db.func.max(Message.id).label("last_id")).where(
+        Message.sender_id == current_user_id
+    ).group_by(Message.receiver_id)
+    received = db.select(Message.sender_id.label("other_id"), db.func.max(Message.id).label("last_id")).where(
+        Message.receiver_id == current_user_id
+    ).group_by(Message.sender_id)
+    both = db.union_all(sent, received).subquery()
+    latest = db.select(both.c.other_id, db.func.max(both.c.last_id).label("last_id")).group_by(both.c.other_id).subquery()
+    unread = db.select(Message.sender_id.label("other_id"), db.func.count().label("unread")).where(
+        Message.receiver_id == current_user_id, Message.read_at.is_(None)
+    ).group_by(Message.sender_id).subquery()
+
+    query = db.select(
+        latest.c.other_id, User.email, User.username, Message.id, Message.content, Message.timestamp,
+        (Message.sender_id == current_user_id).label("from_me"),
+        db.func.coalesce(unread.c.unread, 0).label("unread")
+    ).select_from(latest).join(Message, Message.id == latest.c.last_id).join(
+        User, User.id == latest.c.other_id
+    ).outerjoin(unread, unread.c.other_id == latest.c.other_id).where(latest.c.other_id != current_user_id)
+    try:
+        rows, next_cursor = paginate(query, [Message.id], limit, cursor, "conversations", descending=True)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"conversations": [conversation_dict(row) for row in rows], "next_cursor": next_cursor})
+
+@app.route("/conversations/<int:user_id>", methods=["GET"]) # The thread with one user, newest first a page (limit, cursor) at a time, marks what it returns from them as read
+@jwt_required()
+def get_conversation(user_id):
+    current_user_id = int(get_jwt_identity())
+    if user_id == current_user_id:
+        return jsonify({"error": "Cannot open a conversation with yourself"}), 400
+    if not db.session.get(User, user_id):
+        return jsonify({"error": "User not found"}), 404
+    cursor = request.args.get("cursor", "").strip()
+    try:
+        limit = parse_limit(request.args.get("limit"), app.config["MESSAGES_PAGE_SIZE"], app.config["MAX_PAGE_SIZE"])
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+
+    fields = (Message.id, Message.sender_id, Message.receiver_id, Message.content, Message.timestamp, Message.read_at)
+    # one direction per half, each walking (sender_id, receiver_id, id) backwards from the cursor
+    sent = db.select(*fields).where(Message.sender_id == current_user_id, Message.receiver_id == user_id)
+    received = db.select(*fields).where(Message.sender_id == user_id, Message.receiver_id == current_user_id)
+    try:
+        rows, next_cursor = paginate_union([sent, received], Message.id, limit, cursor, "conversation")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if rows: # everything they sent up to the newest message on this page has now been seen
+        db.session.execute(
+            db.update(Message)
+            .where(Message.receiver_id == current_user_id, Message.sender_id == user_id,
+                   Message.read_at.is_(None), Message.id <= rows[0].id)
+            .values(read_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+    return jsonify({"messages": [thread_message_dict(row) for row in rows], "next_cursor": next_cursor})
+
+
+
+@app.cli.command("sweep-bookings") # flask sweep-bookings, one sweep of stale pending bookings right now
+def sweep_bookings_command():
+    click.echo(f"Expired {booking_sweeper.run_once(app)} pending bookings")
+
+@app.cli.command("drain-outbox") # flask drain-outbox, delivers every due booking event now, for when OUTBOX_WORKERS is 0
+def drain_outbox_command():
+    counts = outbox_dispatcher.drain(app)
+    click.echo(f"Delivered {counts['delivered']} outbox events, {counts['retried']} to retry, {counts['failed']} failed")
+
+@app.cli.command("reconcile-balances") # flask reconcile-balances, exits 1 when any balance disagrees with the payment history
+@click.option("--chunk-size", type=int, default=None, help="Rows read per query")
+@click.option("--show", type=int, default=20, help="How many of the largest drifts to list")
+def reconcile_balances_command(chunk_size, show):
+    report = reconcile_balances(chunk_size or app.config["RECONCILE_CHUNK_SIZE"], show)
+    for user_id, expected, stored in report["worst"]:
+        click.echo(f"user {user_id}: expected {ledger_payments.format_cents(expected)}, stored {ledger_payments.format_cents(stored)}")
+    click.echo(
+        f"Checked {report['users']} users against {report['payments']} payments, "
+        f"{report['drifted']} balances drifted by {ledger_payments.format_cents(report['total_drift_cents'])} in total"
+    )
+    if report["drifted"]:
+        raise SystemExit(1)
 
 # etc #
 @app.route("/")
@@ -368,4 +1040,6 @@ def serve_static(filename):
     return send_from_directory('static', filename)
 
 if __name__ == "__main__":
+    with app.app_context():
+        location_index.rebuild() # warm the autocomplete index before the first request
     app.run(debug=True)
@@ -1,3 +1,4 @@
+from datetime import date
 from models import Car 
 """ Simple builder that creates cars in a step by step way, like making the model, then year, then price, etc."""
 class CarBuilder:
@@ -24,5 +25,13 @@ class CarBuilder:
         self.car.location = location
         return self
     
-    def build(self):
+    def build(self): # Refuses to hand over an incomplete or nonsensical listing
+        for field in ("make", "model", "year", "price_per_day", "location"):
+            value = getattr(self.car, field)
+            if value is None or (isinstance(value, str) and not value.strip()):
+                raise ValueError(f"Missing {field}")
+        if not 0 < self.car.price_per_day < float("inf"): # also catches nan
+            raise ValueError("price_per_day must be positive")
+        if not 1886 <= self.car.year <= date.today().year + 1:
+            raise ValueError("Invalid year")
         return self.car
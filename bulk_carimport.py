@@ -0,0 +1,77 @@
+# bulk_carimport.py streams NDJSON or CSV car listings through CarBuilder and inserts them in executemany batches, collecting a per row error report
+import csv
+import json
+from datetime import datetime
+from sqlalchemy import insert
+from builder_carlisting import CarBuilder
+from models import db, Car
+from observer_commitevents import commit_observer
+
+def read_rows(lines, fmt): # Yields (row number, dict) pairs, or (row number, error message) for rows that can't be parsed
+    if fmt == "csv":
+        for number, row in enumerate(csv.DictReader(lines), start=1):
+            yield number, row
+        return
+    for number, line in enumerate(lines, start=1): # NDJSON rows are numbered by line, blank lines are skipped
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield number, "Invalid JSON"
+            continue
+        yield number, row if isinstance(row, dict) else "Expected a JSON object"
+
+REQUIRED_FIELDS = ("make", "model", "year", "price_per_day", "location")
+
+def car_values(row, owner_id): # Same builder chain as POST /cars, but returns plain column values for a Core insert
+    missing = [field for field in REQUIRED_FIELDS if row.get(field) in (None, "")]
+    if missing:
+        raise ValueError(f"Missing {', '.join(missing)}")
+    car = (CarBuilder().set_make(row.get("make"))
+              .set_model(row.get("model"))
+              .set_year(int(row.get("year")))
+              .set_price(float(row.get("price_per_day")))
+              .set_location(row.get("location"))
+              .build())
+    return {
+        "make": car.make,
+        "model": car.model,
+        "year": car.year,
+        "price_per_day": car.price_per_day,
+        "location": car.location,
+        "owner_id": owner_id,
+        "available": True,
+        "updated_at": datetime.utcnow()
+    }
+
+def _insert_batch(batch):
+    db.session.execute(insert(Car), batch) # one executemany, no ORM objects
+    db.session.commit()
+    commit_observer.notify([("car", "insert", values) for values in batch]) # Core inserts bypass the session hooks
+
+def import_cars(lines, fmt, owner_id, batch_size, max_errors):
+    inserted, failed, errors, batch = 0, 0, [], []
+    for number, row in read_rows(lines, fmt):
+        try:
+            if isinstance(row, str):
+                raise ValueError(row)
+            batch.append(car_values(row, owner_id))
+        except (TypeError, ValueError) as e:
+            failed += 1
+            if len(errors) < max_errors:
+                errors.append({"row": number, "error": str(e)})
+            continue
+        if len(batch) >= batch_size:
+            _insert_batch(batch)
+            inserted += len(batch)
+            batch = []
+    if batch:
+        _insert_batch(batch)
+        inserted += len(batch)
+    return {
+        "inserted": inserted,
+        "failed": failed,
+        "errors": errors,
+        "errors_truncated": failed > len(errors)
+    }
@@ -0,0 +1,62 @@
+# cache_carsearch.py is an in process LRU/TTL cache of serialized GET /cars responses, tagged with the catalogue watermark read from the database so writes from any process retire them
+import threading
+import time
+from collections import OrderedDict
+
+class SearchResultCache:
+    def __init__(self, max_entries=512, ttl_seconds=60):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict() # key -> (watermark, expires_at, body)
+        self._lock = threading.Lock()
+
+    def configure(self, max_entries, ttl_seconds):
+        with self._lock:
+            self.max_entries = max_entries
+            self.ttl_seconds = ttl_seconds
+            self._entries.clear()
+
+    def key_for(self, args, case_insensitive=()): # Same search, same key, whatever the parameter order, spacing or (where it doesn't matter) case
+        return tuple(sorted(
+            (name, value.strip().lower() if name in case_insensitive else value.strip())
+            for name, value in args.items(multi=True)
+        ))
+
+    def get(self, key, watermark): # watermark is the current catalogue version (and the one the response's ETag was built from), a body cached under another one is stale
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            cached_watermark, expires_at, body = entry
+            if cached_watermark != watermark or expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, watermark, body): # watermark is the one read before the query ran, so a result that raced a commit is never stored as current
+        with self._lock:
+            self._entries[key] = (watermark, time.monotonic() + self.ttl_seconds, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+search_cache = SearchResultCache()
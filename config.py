@@ -6,5 +6,40 @@ class Config:
     SECRET_KEY = 'random-key'
     SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(basedir, 'app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    CARS_PAGE_SIZE = 50
+    MAX_PAGE_SIZE = 200
+    MESSAGES_PAGE_SIZE = 50 # inbox messages per GET /users/<id>/messages
+    PAYMENTS_PAGE_SIZE = 50 # payments per GET /payments
+    SEARCH_CACHE_SIZE = 512 # cached GET /cars responses
+    SEARCH_CACHE_TTL = 60 # seconds
+    AVAILABILITY_TTL = 30 # seconds a car's in memory booking list is trusted before it is reloaded, covers commits from other processes
+    BULK_IMPORT_BATCH_SIZE = 1000 # rows per executemany insert and commit
+    BULK_IMPORT_MAX_BATCH_SIZE = 10000
+    BULK_IMPORT_MAX_ERRORS = 1000 # rejected rows listed in the import report
+    STREAM_BATCH_SIZE = 1000 # rows fetched per round trip by streamed responses
+    BOOKING_BATCH_MAX = 50 # bookings per POST /bookings/batch
+    BOOKING_MAX_DAYS = 366 # longest stay, every held day is a booking_slot row written in the request
+    BOOKING_HOLD_TTL = 24 * 60 * 60 # seconds a pending booking holds its car before the sweeper expires it
+    BOOKING_SWEEP_INTERVAL = 5 * 60 # seconds between sweeps, 0 turns the sweeper off
+    BOOKING_SWEEP_BATCH = 500 # bookings expired per transaction
+    OUTBOX_WORKERS = 4 # threads delivering booking events to subscribers, 0 leaves delivery to flask drain-outbox
+    OUTBOX_POLL_INTERVAL = 5 # seconds between outbox scans when no new event wakes the workers
+    OUTBOX_BATCH_SIZE = 100 # due events picked up per scan
+    OUTBOX_MAX_ATTEMPTS = 5 # deliveries tried before an event is marked failed
+    OUTBOX_RETRY_BACKOFF = 2 # seconds before the first retry, doubled for each one after
+    OUTBOX_LEASE = 60 # seconds a worker holds an event before another may retry it
+    OUTBOX_RETENTION = 7 * 24 * 60 * 60 # seconds delivered events are kept before the sweeper deletes them
+    BACKGROUND_WORKERS = True # start the booking sweeper and outbox pool with the first request
+    RECONCILE_CHUNK_SIZE = 200000 # rows per query for flask reconcile-balances
+    IDEMPOTENCY_TTL = 24 * 60 * 60 # seconds a stored Idempotency-Key response is replayed, the sweeper purges it after
+    IDEMPOTENCY_LOCK_TIMEOUT = 60 # seconds before an unfinished request's key may be claimed by a retry
+    IDEMPOTENCY_CACHE_SIZE = 1024 # finished responses kept in memory in front of the table
+    PASSWORD_HASH_METHOD = "scrypt:32768:8:1" # Werkzeug method with every parameter spelled out, changing it rehashes each user at their next login
+    PASSWORD_HASH_WORKERS = 2 # processes hashing and checking passwords, 0 does it in the request thread
+    PASSWORD_HASH_QUEUE = 8 # hashes allowed to wait for a worker before requests get 503
+    PASSWORD_HASH_TIMEOUT = 10 # seconds to wait for one hash
+    JWT_TOKEN_LOCATION = ["headers"] # GET /stream alone also takes ?jwt=, EventSource can't send headers
+    STREAM_HEARTBEAT = 15 # seconds between keep-alive comments on an idle GET /stream
+    STREAM_QUEUE_SIZE = 100 # events buffered per connection before a slow client is cut off to resync
 
 #Just some config settings for flask, such as the secret key
@@ -0,0 +1,17 @@
+# fts_carsearch.py builds ranked searches against car_fts, the FTS5 index over car make/model/location that the database keeps in sync through triggers
+import re
+from sqlalchemy import text, Integer, Float
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+def build_match_query(search_text): # Every word becomes a quoted prefix term, so "toy cam" matches "Toyota Camry"
+    words = _WORD.findall(search_text.lower())
+    return " ".join(f'"{word}"*' for word in words)
+
+def car_match_subquery(search_text): # Returns a (car_id, rank) subquery of matching cars, a lower rank is a better match, or None if there is nothing to search for
+    match = build_match_query(search_text)
+    if not match:
+        return None
+    return text(
+        "SELECT rowid AS car_id, bm25(car_fts) AS rank FROM car_fts WHERE car_fts MATCH :match"
+    ).bindparams(match=match).columns(car_id=Integer, rank=Float).subquery("car_match")
@@ -0,0 +1,146 @@
+# idempotency_requestreplay.py makes POST endpoints safe to retry with an Idempotency-Key header, the first response is stored and replayed instead of running the view again
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import current_app, jsonify, make_response, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from models import db, IdempotencyKey
+
+class ReplayCache: # Small LRU of finished responses in front of the idempotency_key table, the table stays the source of truth
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict() # (user id, key) -> (fingerprint, status code, body, expires_at)
+        self._lock = threading.Lock()
+
+    def configure(self, max_entries):
+        with self._lock:
+            self.max_entries = max_entries
+            self._entries.clear()
+
+    def get(self, cache_key):
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                return None
+            if entry[3] < datetime.utcnow():
+                del self._entries[cache_key]
+                return None
+            self._entries.move_to_end(cache_key)
+            return entry
+
+    def put(self, cache_key, entry):
+        with self._lock:
+            self._entries[cache_key] = entry
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+replay_cache = ReplayCache()
+
+def _fingerprint(): # The same key sent with a different request is a client bug, not a retry
+    digest = hashlib.sha256(f"{request.method} {request.path}\n".encode())
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+def _replay(fingerprint, entry):
+    if entry[0] != fingerprint:
+        return jsonify({"error": "Idempotency-Key was already used for a different request"}), 422
+    response = current_app.response_class(entry[2], status=entry[1], mimetype="application/json")
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+def _claim(user_id, key, fingerprint): # True when this request gets to run the view, otherwise the row that beat it
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=current_app.config["IDEMPOTENCY_TTL"])
+    try: # a placeholder row first, the primary key lets only one of several concurrent retries through
+        db.session.add(IdempotencyKey(user_id=user_id, key=key, fingerprint=fingerprint, created_at=now, expires_at=expires_at))
+        db.session.commit()
+        return True, None
+    except IntegrityError:
+        db.session.rollback()
+    stale = now - timedelta(seconds=current_app.config["IDEMPOTENCY_LOCK_TIMEOUT"])
+    taken_over = db.session.execute( # an expired key, or a placeholder whose request died, can be claimed again
+        update(IdempotencyKey)
+        .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key, db.or_(
+            IdempotencyKey.expires_at < now,
+            db.and_(IdempotencyKey.status_code.is_(None), IdempotencyKey.created_at < stale)
+        ))
+        .values(fingerprint=fingerprint, status_code=None, response_body=None, created_at=now, expires_at=expires_at)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    if taken_over:
+        return True, None
+    return False, db.session.get(IdempotencyKey, (user_id, key))
+
+def _release(user_id, key): # The view failed, so a retry with the same key should run it again
+    db.session.rollback()
+    db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key))
+    db.session.commit()
+
+def idempotent(view): # Goes under @jwt_required(), keys are scoped to the user
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get("Idempotency-Key", "").strip()
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > 255:
+            return jsonify({"error": "Idempotency-Key must be at most 255 characters"}), 400
+
+        user_id = int(get_jwt_identity())
+        cache_key = (user_id, key)
+        fingerprint = _fingerprint()
+        entry = replay_cache.get(cache_key)
+        if entry:
+            return _replay(fingerprint, entry)
+
+        claimed, row = _claim(user_id, key, fingerprint)
+        if not claimed:
+            if row is None: # evicted between our insert and our read, the client can simply retry
+                return jsonify({"error": "Idempotency-Key is being reset, retry"}), 409
+            if row.status_code is None:
+                response = jsonify({"error": "A request with this Idempotency-Key is still in progress"})
+                response.headers["Retry-After"] = "1"
+                return response, 409
+            entry = (row.fingerprint, row.status_code, row.response_body, row.expires_at)
+            replay_cache.put(cache_key, entry)
+            return _replay(fingerprint, entry)
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            _release(user_id, key)
+            raise
+        if response.status_code >= 500 or response.is_streamed:
+            _release(user_id, key)
+            return response
+
+        body = response.get_data(as_text=True)
+        row = db.session.get(IdempotencyKey, cache_key)
+        if row is None: # purged while the view ran, nothing to replay from
+            return response
+        row.status_code = response.status_code
+        row.response_body = body
+        db.session.commit()
+        replay_cache.put(cache_key, (fingerprint, response.status_code, body, row.expires_at))
+        return response
+    return wrapper
+
+def purge_expired_keys(batch_size): # Called by the booking sweeper, returns how many rows went
+    purged = 0
+    while True:
+        expired = db.select(IdempotencyKey.user_id, IdempotencyKey.key).where(
+            IdempotencyKey.expires_at < datetime.utcnow()
+        ).limit(batch_size)
+        count = db.session.execute(
+            delete(IdempotencyKey).where(db.tuple_(IdempotencyKey.user_id, IdempotencyKey.key).in_(expired))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        purged += count
+        if count < batch_size:
+            return purged
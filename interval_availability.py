@@ -0,0 +1,110 @@
+# interval_availability.py keeps every car's holding bookings as a sorted interval list in memory, used for booking conflict checks and the availability calendar
+import bisect
+import threading
+import time
+from datetime import timedelta
+from models import db, Booking, BookingSlot, ACTIVE_BOOKING_STATUSES
+from observer_commitevents import commit_observer
+
+class CarIntervals: # One car's bookings sorted by start, max_ends[i] is the latest end among the first i+1 so overlap checks are a single bisect
+    def __init__(self, intervals):
+        self.intervals = sorted(intervals)
+        self.starts = [interval[0] for interval in self.intervals]
+        self.max_ends = []
+        for interval in self.intervals:
+            self.max_ends.append(max(interval[1], self.max_ends[-1]) if self.max_ends else interval[1])
+
+    def overlaps(self, start_date, end_date):
+        count = bisect.bisect_right(self.starts, end_date) # bookings starting on or before end_date
+        return count > 0 and self.max_ends[count - 1] >= start_date
+
+    def between(self, start_date, end_date):
+        count = bisect.bisect_right(self.starts, end_date)
+        return [interval for interval in self.intervals[:count] if interval[1] >= start_date]
+
+    def replace(self, booking_id, interval): # New copy without booking_id, plus interval if given, readers keep the old one
+        kept = [existing for existing in self.intervals if existing[2] != booking_id]
+        if interval:
+            kept.append(interval)
+        return CarIntervals(kept)
+
+class CarAvailabilityIndex:
+    def __init__(self, ttl_seconds=30):
+        self.ttl_seconds = ttl_seconds # commits made by other processes only show up once a car's list is reloaded
+        self._lock = threading.Lock()
+        self._cars = {} # car_id -> (CarIntervals, loaded_at), filled the first time a car is asked about
+        self._generations = {} # car_id -> change counter, stops a slow load from storing data older than a commit
+
+    def configure(self, ttl_seconds):
+        with self._lock:
+            self.ttl_seconds = ttl_seconds
+            self._cars.clear()
+
+    def invalidate(self, car_id): # Next question about the car reloads it
+        with self._lock:
+            self._cars.pop(car_id, None)
+            self._generations[car_id] = self._generations.get(car_id, 0) + 1
+
+    def _for_car(self, car_id):
+        with self._lock:
+            entry = self._cars.get(car_id)
+            generation = self._generations.get(car_id, 0)
+        if entry is not None and entry[1] + self.ttl_seconds > time.monotonic():
+            return entry[0]
+
+        rows = db.session.execute(
+            db.select(Booking.start_date, Booking.end_date, Booking.id, Booking.status)
+            .where(Booking.car_id == car_id, Booking.status.in_(ACTIVE_BOOKING_STATUSES))
+        ).all()
+        intervals = CarIntervals([tuple(row) for row in rows])
+        with self._lock:
+            if self._generations.get(car_id, 0) == generation:
+                self._cars[car_id] = (intervals, time.monotonic())
+        return intervals
+
+    def is_free(self, car_id, start_date, end_date):
+        return not self._for_car(car_id).overlaps(start_date, end_date)
+
+    def confirm_busy(self, car_id, start_date, end_date): # A busy answer checked against booking_slot, another process may have freed the days since the list was loaded
+        held = db.session.scalar(
+            db.select(BookingSlot.day).where(BookingSlot.car_id == car_id, BookingSlot.day.between(start_date, end_date)).limit(1)
+        )
+        if held is None:
+            self.invalidate(car_id)
+        return held is not None
+
+    def calendar(self, car_id, start_date, end_date): # Booked and free date ranges (both inclusive) between start_date and end_date
+        booked, free = [], []
+        next_free = start_date
+        for booked_start, booked_end, booking_id, status in self._for_car(car_id).between(start_date, end_date):
+            booked.append({
+                "start_date": booked_start.isoformat(),
+                "end_date": booked_end.isoformat(),
+                "status": status
+            })
+            if booked_start > next_free:
+                free.append({
+                    "start_date": next_free.isoformat(),
+                    "end_date": (booked_start - timedelta(days=1)).isoformat()
+                })
+            next_free = max(next_free, booked_end + timedelta(days=1))
+        if next_free <= end_date:
+            free.append({"start_date": next_free.isoformat(), "end_date": end_date.isoformat()})
+        return booked, free
+
+    def apply_changes(self, changes): # Commit observer callback, moves committed booking rows into or out of their car's list
+        with self._lock:
+            for table, action, values in changes:
+                if table != "booking":
+                    continue
+                car_id = values["car_id"]
+                self._generations[car_id] = self._generations.get(car_id, 0) + 1
+                entry = self._cars.get(car_id)
+                if entry is None:
+                    continue
+                holding = action != "delete" and values["status"] in ACTIVE_BOOKING_STATUSES
+                interval = (values["start_date"], values["end_date"], values["id"], values["status"]) if holding else None
+                self._cars[car_id] = (entry[0].replace(values["id"], interval), entry[1]) # still as old as its last load
+
+availability_index = CarAvailabilityIndex()
+commit_observer.subscribe(availability_index.apply_changes)
@@ -0,0 +1,43 @@
+# ledger_payments.py moves money between users in integer cents, each balance change is a conditional UPDATE plus an append only ledger entry, in the caller's transaction
+from decimal import Decimal, ROUND_HALF_UP
+from sqlalchemy import update
+from models import db, User, Payment, LedgerEntry
+
+class LedgerError(Exception): # The message is safe to show the client
+    pass
+
+def to_cents(amount): # Dollars (float, str or Decimal) to whole cents, rounded half up once here rather than drifting in float arithmetic
+    return int((Decimal(str(amount)) * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+def cents_to_decimal_string(cents): # 14000 -> "140.00", exact where float formatting might not be
+    sign = "-" if cents < 0 else ""
+    return f"{sign}{abs(cents) // 100}.{abs(cents) % 100:02d}"
+
+def format_cents(cents):
+    return "$" + cents_to_decimal_string(cents)
+
+def _apply(user_id, delta_cents, require_funds=False): # One UPDATE, the balance is never read into Python, so two payments can't overwrite each other
+    condition = [User.id == user_id]
+    if require_funds:
+        condition.append(User.balance_cents >= -delta_cents)
+    return db.session.execute(
+        update(User).where(*condition).values(balance_cents=User.balance_cents + delta_cents)
+        .execution_options(synchronize_session=False)
+    ).rowcount == 1
+
+def transfer(sender_id, receiver_id, amount_cents, booking_id): # Returns the new Payment, raises LedgerError and leaves the rollback to the caller
+    if amount_cents <= 0:
+        raise LedgerError("Invalid amount")
+    if not _apply(sender_id, -amount_cents, require_funds=True):
+        raise LedgerError("Insufficient funds")
+    if not _apply(receiver_id, amount_cents):
+        raise LedgerError("Invalid users")
+
+    payment = Payment(sender_id=sender_id, receiver_id=receiver_id, amount_cents=amount_cents, booking_id=booking_id)
+    db.session.add(payment)
+    db.session.flush()
+    db.session.add_all([
+        LedgerEntry(user_id=sender_id, payment_id=payment.id, amount_cents=-amount_cents, kind="debit"),
+        LedgerEntry(user_id=receiver_id, payment_id=payment.id, amount_cents=amount_cents, kind="credit")
+    ])
+    return payment
@@ -45,6 +45,19 @@ target_db = current_app.extensions['migrate'].db
 # ... etc.
 
 
+# expression indexes autogenerate cannot reflect on SQLite, it would drop and recreate them on every revision
+EXPRESSION_INDEXES = {"ix_car_available_make_year"}
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    # car_fts and its shadow tables are managed by hand in the migrations, not by the models
+    if type_ == "table" and name.startswith("car_fts"):
+        return False
+    if type_ == "index" and name in EXPRESSION_INDEXES:
+        return False
+    return True
+
+
 def get_metadata():
     if hasattr(target_db, 'metadatas'):
         return target_db.metadatas[None]
@@ -65,7 +78,8 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=get_metadata(), literal_binds=True
+        url=url, target_metadata=get_metadata(), literal_binds=True,
+        include_object=include_object
     )
 
     with context.begin_transaction():
@@ -100,6 +114,7 @@ def run_migrations_online():
         context.configure(
             connection=connection,
             target_metadata=get_metadata(),
+            include_object=include_object,
             **conf_args
         )
 
@@ -0,0 +1,28 @@
+"""booking created_at for the pending hold sweeper
+
+Revision ID: 1f49d14f5e81
+Revises: b87dee442be5
+Create Date: 2026-10-18 15:30:12.774106
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1f49d14f5e81'
+down_revision = 'b87dee442be5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('booking', sa.Column('created_at', sa.DateTime(), nullable=True))
+    # Existing pending bookings start their hold now instead of all expiring on the first sweep
+    op.execute('UPDATE booking SET created_at = CURRENT_TIMESTAMP')
+    op.create_index('ix_booking_status_created_at', 'booking', ['status', 'created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_booking_status_created_at', table_name='booking')
+    op.drop_column('booking', 'created_at')
@@ -0,0 +1,32 @@
+"""message read_at and conversation indexes
+
+Revision ID: 27e4bd26b99f
+Revises: 3baec25a86c1
+Create Date: 2026-10-18 18:26:51.930472
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '27e4bd26b99f'
+down_revision = '3baec25a86c1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('message', sa.Column('read_at', sa.DateTime(), nullable=True))
+    # Messages from before read tracking count as read, so nobody starts out with their whole history unread
+    op.execute('UPDATE message SET read_at = timestamp')
+    op.create_index('ix_message_sender_receiver_id', 'message', ['sender_id', 'receiver_id', 'id'], unique=False)
+    op.create_index('ix_message_receiver_sender_id', 'message', ['receiver_id', 'sender_id', 'id'], unique=False)
+    op.create_index('ix_message_unread', 'message', ['receiver_id', 'sender_id'], unique=False, sqlite_where=sa.text('read_at IS NULL'))
+
+
+def downgrade():
+    op.drop_index('ix_message_unread', table_name='message')
+    op.drop_index('ix_message_receiver_sender_id', table_name='message')
+    op.drop_index('ix_message_sender_receiver_id', table_name='message')
+    op.drop_column('message', 'read_at')
@@ -0,0 +1,32 @@
+"""updated_at watermarks for etags
+
+Revision ID: 2d36ed9f03ab
+Revises: 75ed3d4d8e87
+Create Date: 2026-10-18 11:20:53.918274
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2d36ed9f03ab'
+down_revision = '75ed3d4d8e87'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Plain ADD COLUMN rather than batch mode, rebuilding car would drop the car_fts triggers
+    for table in ('user', 'car', 'booking'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=True))
+        op.execute(f'UPDATE "{table}" SET updated_at = CURRENT_TIMESTAMP')
+        op.create_index(f'ix_{table}_updated_at', table, ['updated_at'], unique=False)
+    op.create_index('ix_booking_user_updated_at', 'booking', ['user_id', 'updated_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_booking_user_updated_at', table_name='booking')
+    for table in ('booking', 'car', 'user'):
+        op.drop_index(f'ix_{table}_updated_at', table_name=table)
+        op.drop_column(table, 'updated_at') # needs SQLite 3.35+, again to keep car's triggers
@@ -0,0 +1,24 @@
+"""message (receiver_id, id) index for inbox paging
+
+Revision ID: 3baec25a86c1
+Revises: 0d9a9ed94146
+Create Date: 2026-10-18 17:58:03.418266
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3baec25a86c1'
+down_revision = '0d9a9ed94146'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_message_receiver_id_id', 'message', ['receiver_id', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_message_receiver_id_id', table_name='message')
@@ -0,0 +1,26 @@
+"""owner summary indexes
+
+Revision ID: 5b120483e111
+Revises: 1f49d14f5e81
+Create Date: 2026-10-18 16:48:20.115930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b120483e111'
+down_revision = '1f49d14f5e81'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_car_owner_id'), 'car', ['owner_id'], unique=False)
+    op.create_index(op.f('ix_payment_booking_id'), 'payment', ['booking_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_payment_booking_id'), table_name='payment')
+    op.drop_index(op.f('ix_car_owner_id'), table_name='car')
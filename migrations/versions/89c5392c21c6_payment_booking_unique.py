@@ -0,0 +1,33 @@
+"""one payment per booking
+
+Revision ID: 89c5392c21c6
+Revises: c80bd06b5ca5
+Create Date: 2026-10-18 21:02:47.519302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '89c5392c21c6'
+down_revision = 'c80bd06b5ca5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SQLite DDL is not transactional here, so refuse before dropping the old index rather than fail half way on the unique one
+    duplicates = op.get_bind().execute(sa.text(
+        "SELECT booking_id, group_concat(id) FROM payment GROUP BY booking_id HAVING count(*) > 1"
+    )).all()
+    if duplicates:
+        listing = "; ".join(f"booking {booking_id}: payments {payment_ids}" for booking_id, payment_ids in duplicates)
+        raise RuntimeError(f"Bookings paid more than once, refund and delete the extra payments before upgrading: {listing}")
+    op.drop_index('ix_payment_booking_id', table_name='payment')
+    op.create_index('ix_payment_booking_id', 'payment', ['booking_id'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_payment_booking_id', table_name='payment')
+    op.create_index('ix_payment_booking_id', 'payment', ['booking_id'], unique=False)
@@ -0,0 +1,28 @@
+"""car search filter indexes
+
+Revision ID: afd146e001b4
+Revises: 2d36ed9f03ab
+Create Date: 2026-10-18 12:41:06.377915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'afd146e001b4'
+down_revision = '2d36ed9f03ab'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_car_available_price', 'car', ['available', 'price_per_day'], unique=False)
+    op.create_index('ix_car_available_year', 'car', ['available', 'year'], unique=False)
+    op.create_index('ix_car_available_make_year', 'car', ['available', sa.text('make COLLATE NOCASE'), 'year'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_car_available_make_year', table_name='car')
+    op.drop_index('ix_car_available_year', table_name='car')
+    op.drop_index('ix_car_available_price', table_name='car')
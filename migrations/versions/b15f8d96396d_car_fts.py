@@ -0,0 +1,50 @@
+"""car full text search index
+
+Revision ID: b15f8d96396d
+Revises: 765678e0eee8
+Create Date: 2026-10-18 09:12:41.503112
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b15f8d96396d'
+down_revision = '765678e0eee8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # External content FTS5 table, the text itself stays in car and the triggers keep the index in step with it
+    op.execute(
+        "CREATE VIRTUAL TABLE car_fts USING fts5("
+        "make, model, location, content='car', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2')"
+    )
+    op.execute(
+        "CREATE TRIGGER car_fts_ai AFTER INSERT ON car BEGIN "
+        "INSERT INTO car_fts(rowid, make, model, location) "
+        "VALUES (new.id, new.make, new.model, new.location); END"
+    )
+    op.execute(
+        "CREATE TRIGGER car_fts_ad AFTER DELETE ON car BEGIN "
+        "INSERT INTO car_fts(car_fts, rowid, make, model, location) "
+        "VALUES ('delete', old.id, old.make, old.model, old.location); END"
+    )
+    op.execute(
+        "CREATE TRIGGER car_fts_au AFTER UPDATE OF make, model, location ON car BEGIN "
+        "INSERT INTO car_fts(car_fts, rowid, make, model, location) "
+        "VALUES ('delete', old.id, old.make, old.model, old.location); "
+        "INSERT INTO car_fts(rowid, make, model, location) "
+        "VALUES (new.id, new.make, new.model, new.location); END"
+    )
+    op.execute("INSERT INTO car_fts(car_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS car_fts_au")
+    op.execute("DROP TRIGGER IF EXISTS car_fts_ad")
+    op.execute("DROP TRIGGER IF EXISTS car_fts_ai")
+    op.execute("DROP TABLE IF EXISTS car_fts")
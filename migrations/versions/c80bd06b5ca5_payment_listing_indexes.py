@@ -0,0 +1,26 @@
+"""payment (sender_id, id) and (receiver_id, id) indexes
+
+Revision ID: c80bd06b5ca5
+Revises: e4d976873ba5
+Create Date: 2026-10-18 20:15:09.337521
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c80bd06b5ca5'
+down_revision = 'e4d976873ba5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_payment_sender_id_id', 'payment', ['sender_id', 'id'], unique=False)
+    op.create_index('ix_payment_receiver_id_id', 'payment', ['receiver_id', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_payment_receiver_id_id', table_name='payment')
+    op.drop_index('ix_payment_sender_id_id', table_name='payment')
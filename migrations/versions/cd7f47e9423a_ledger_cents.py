@@ -0,0 +1,64 @@
+"""integer cent balances and payments, ledger_entry
+
+Revision ID: cd7f47e9423a
+Revises: 27e4bd26b99f
+Create Date: 2026-10-18 19:04:37.285190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'cd7f47e9423a'
+down_revision = '27e4bd26b99f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('user', sa.Column('balance_cents', sa.Integer(), server_default='0', nullable=False))
+    op.execute('UPDATE user SET balance_cents = CAST(ROUND(COALESCE(balance, 0) * 100) AS INTEGER)')
+    op.add_column('payment', sa.Column('amount_cents', sa.Integer(), server_default='0', nullable=False))
+    op.execute('UPDATE payment SET amount_cents = CAST(ROUND(amount * 100) AS INTEGER)')
+
+    op.create_table('ledger_entry',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('payment_id', sa.Integer(), nullable=True),
+    sa.Column('amount_cents', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['payment_id'], ['payment.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_ledger_entry_user_id_id', 'ledger_entry', ['user_id', 'id'], unique=False)
+    op.create_index(op.f('ix_ledger_entry_payment_id'), 'ledger_entry', ['payment_id'], unique=False)
+    # Today's balances become opening entries, the ledger only has to explain what happens from here on
+    op.execute(
+        "INSERT INTO ledger_entry (user_id, amount_cents, kind, created_at) "
+        "SELECT id, balance_cents, 'opening', CURRENT_TIMESTAMP FROM user"
+    )
+
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.drop_column('amount')
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('balance')
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('balance', sa.Float(), nullable=True))
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('amount', sa.Float(), server_default='0', nullable=False))
+    op.execute('UPDATE user SET balance = balance_cents / 100.0')
+    op.execute('UPDATE payment SET amount = amount_cents / 100.0')
+
+    op.drop_index(op.f('ix_ledger_entry_payment_id'), table_name='ledger_entry')
+    op.drop_index('ix_ledger_entry_user_id_id', table_name='ledger_entry')
+    op.drop_table('ledger_entry')
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.drop_column('amount_cents')
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('balance_cents')
@@ -1,9 +1,11 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from pool_passwordhashing import password_hasher
 
 db = SQLAlchemy()
 
+ACTIVE_BOOKING_STATUSES = ("pending", "confirmed") # bookings in these states hold the car for their dates
+
 class User(db.Model): #Represents the user, storing things like balance, login info, sequrity questions
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(100), nullable=False)
@@ -15,15 +17,23 @@ class User(db.Model): #Represents the user, storing things like balance, login i
     security_answer_2 = db.Column(db.String(100))
     security_question_3 = db.Column(db.String(100))
     security_answer_3 = db.Column(db.String(100))
-    balance = db.Column(db.Float, default=0.0)
+    balance_cents = db.Column(db.Integer, nullable=False, default=0, server_default='0') # only changed through ledger_payments, alongside a LedgerEntry
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     cars = db.relationship('Car', backref='owner', lazy=True)
     bookings = db.relationship('Booking', backref='user', lazy=True)
 
-    def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+    @property
+    def balance(self): # dollars, for display
+        return self.balance_cents / 100
+
+    def set_password(self, password): # on the hashing pool, HashPoolBusy when it is full
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.check(self.password_hash, password)
+
+    def password_needs_rehash(self): # hashed with other parameters than Config.PASSWORD_HASH_METHOD
+        return password_hasher.needs_rehash(self.password_hash)
 
 class Car(db.Model): #Various car information stored in the database, like the id, make, model
     id = db.Column(db.Integer, primary_key=True)
@@ -33,9 +43,16 @@ class Car(db.Model): #Various car information stored in the database, like the i
     price_per_day = db.Column(db.Float, nullable=False)
     location = db.Column(db.String(100), nullable=False)
     available = db.Column(db.Boolean, default=True)
-    owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     bookings = db.relationship('Booking', backref='car', lazy=True)
 
+    __table_args__ = ( # search filters and sorts, all scoped to available cars
+        db.Index('ix_car_available_price', 'available', 'price_per_day'),
+        db.Index('ix_car_available_year', 'available', 'year'),
+        db.Index('ix_car_available_make_year', 'available', db.text('make COLLATE NOCASE'), 'year'),
+    )
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -54,6 +71,14 @@ class Booking(db.Model): # Represents the bookings that users can make, covering
     start_date = db.Column(db.Date, nullable=False)
     end_date = db.Column(db.Date, nullable=False)
     status = db.Column(db.String(20), default='pending')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+    __table_args__ = ( # serves the overlap checks, car first so each car's bookings sit together
+        db.Index('ix_booking_car_status_dates', 'car_id', 'status', 'start_date', 'end_date'),
+        db.Index('ix_booking_user_updated_at', 'user_id', 'updated_at'),
+        db.Index('ix_booking_status_created_at', 'status', 'created_at'), # the sweeper's oldest pending first scan
+    )
 
     def to_dict(self):
         return {
@@ -66,16 +91,30 @@ class Booking(db.Model): # Represents the bookings that users can make, covering
         }
 
 
+class BookingSlot(db.Model): # One row per car per held day, the primary key is what makes a double booking impossible
+    car_id = db.Column(db.Integer, db.ForeignKey('car.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    booking_id = db.Column(db.Integer, db.ForeignKey('booking.id'), nullable=False, index=True)
+
+
 class Message(db.Model): # message info, id, content, etc. are also stored
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.String(256))
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     receiver_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    read_at = db.Column(db.DateTime) # set when the receiver opens the conversation
 
     sender = db.relationship('User', foreign_keys=[sender_id], backref='sent_messages')
     receiver = db.relationship('User', foreign_keys=[receiver_id], backref='received_messages')
 
+    __table_args__ = (
+        db.Index('ix_message_receiver_id_id', 'receiver_id', 'id'), # inbox pages by since_id/before_id
+        db.Index('ix_message_sender_receiver_id', 'sender_id', 'receiver_id', 'id'), # conversations, latest message per counterpart and the threads
+        db.Index('ix_message_receiver_sender_id', 'receiver_id', 'sender_id', 'id'),
+        db.Index('ix_message_unread', 'receiver_id', 'sender_id', sqlite_where=db.text('read_at IS NULL')), # only unread rows, so unread counts stay small
+    )
+
 class Payment(db.Model): #Payment information is stored aswell such as the sender, id, and amount
     id = db.Column(db.Integer, primary_key=True)
     sender_id = db.Column(
@@ -88,10 +127,60 @@ class Payment(db.Model): #Payment information is stored aswell such as the sende
         db.ForeignKey('user.id', name='fk_payment_receiver'),
         nullable=False
     )
-    amount = db.Column(db.Float, nullable=False)
+    amount_cents = db.Column(db.Integer, nullable=False)
     booking_id = db.Column(
         db.Integer,
         db.ForeignKey('booking.id', name='fk_payment_booking'),
-        nullable=False
+        nullable=False,
+        unique=True, # one payment per booking, concurrent retries included
+        index=True
     )
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_payment_sender_id_id', 'sender_id', 'id'), # GET /payments by role, newest first
+        db.Index('ix_payment_receiver_id_id', 'receiver_id', 'id'),
+    )
+
+    @property
+    def amount(self): # dollars, for display
+        return self.amount_cents / 100
+
+
+class LedgerEntry(db.Model): # Append only, one row per balance change, so every balance_cents is the sum of its user's entries
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    payment_id = db.Column(db.Integer, db.ForeignKey('payment.id'), index=True) # empty for opening balances
+    amount_cents = db.Column(db.Integer, nullable=False) # signed, debits are negative
+    kind = db.Column(db.String(20), nullable=False) # opening, debit or credit
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_ledger_entry_user_id_id', 'user_id', 'id'),
+    )
+
+
+class OutboxEvent(db.Model): # A booking event written in the booking's own transaction, delivered to the observer's subscribers later by the outbox workers
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(20), nullable=False)
+    booking_ids = db.Column(db.JSON, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending') # pending, delivered or failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    available_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow) # next try, pushed forward while a worker holds the event
+    last_error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    delivered_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_outbox_event_status_available_at', 'status', 'available_at'), # the workers' due events scan
+    )
+
+
+class IdempotencyKey(db.Model): # The stored response for an Idempotency-Key, status_code stays empty while the first request is still running
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    key = db.Column(db.String(255), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False) # sha256 of method, path and body
+    status_code = db.Column(db.Integer)
+    response_body = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
@@ -1,33 +1,49 @@
-# observer_bookingnotifications.py maintains a list of callbacks, and notifies them on booking events
-from models import Message, db
+# observer_bookingnotifications.py maintains a list of callbacks, and notifies them on booking events through the outbox
+from models import Message, OutboxEvent, db
 
 class BookingObserver:
     def __init__(self):
         self.subscribers = []
 
-    def subscribe(self, callback):
-        self.subscribers.append(callback)
+    def subscribe(self, callback, batch_callback=None): # batch_callback, if given, gets a whole list of bookings in one call
+        self.subscribers.append((callback, batch_callback))
 
-    def notify(self, booking, message_type):
-        for callback in self.subscribers:
-            callback(booking, message_type)
+    def notify(self, booking, message_type): # Only writes an outbox row in the caller's transaction, the outbox workers run the subscribers, so the booking must be flushed
+        db.session.add(OutboxEvent(event_type=message_type, booking_ids=[booking.id]))
+
+    def notify_many(self, bookings, message_type): # One outbox row for the whole list
+        db.session.add(OutboxEvent(event_type=message_type, booking_ids=[booking.id for booking in bookings]))
+
+    def dispatch(self, bookings, message_type): # Calls the subscribers, used by the outbox workers
+        for callback, batch_callback in self.subscribers:
+            if batch_callback:
+                batch_callback(bookings, message_type)
+            else:
+                for booking in bookings:
+                    callback(booking, message_type)
 
 booking_observer = BookingObserver()
 
-def handle_booking_notification(booking, message_type): # Observer function that creates notifications by calling booking_observer.notify
+def _booking_message(booking, message_type):
     if message_type == "created":
         content = f"New booking request for {booking.car.make}"
     elif message_type == "confirmed":
         content = f"Booking confirmed for {booking.car.make}"
+    elif message_type == "expired":
+        content = f"Booking request for {booking.car.make} expired unpaid"
     else:
         content = "Booking update"
     
-   
-    notification = Message(
+    return Message(
         sender_id=booking.user_id,
         receiver_id=booking.car.owner_id,
         content=content
     )
-    db.session.add(notification)
 
-booking_observer.subscribe(handle_booking_notification)
+def handle_booking_notification(booking, message_type): # Observer function that creates notifications by calling booking_observer.notify
+    db.session.add(_booking_message(booking, message_type))
+
+def handle_booking_notifications(bookings, message_type): # Batch version, all the messages go to the session in one add_all
+    db.session.add_all([_booking_message(booking, message_type) for booking in bookings])
+
+booking_observer.subscribe(handle_booking_notification, handle_booking_notifications)
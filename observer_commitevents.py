@@ -0,0 +1,38 @@
+# observer_commitevents.py tells subscribers which rows changed, once the transaction that changed them has actually committed
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+class CommitObserver:
+    def __init__(self):
+        self.subscribers = []
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def notify(self, changes): # changes is a list of (table name, "insert"/"update"/"delete", column values)
+        for callback in self.subscribers:
+            callback(changes)
+
+commit_observer = CommitObserver()
+
+def _snapshot(obj): # Column values copied out during the flush, the objects are expired by the time the commit finishes
+    return {attr.key: getattr(obj, attr.key) for attr in inspect(obj).mapper.column_attrs}
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session, flush_context):
+    changes = session.info.setdefault("pending_changes", [])
+    for action, objects in (("insert", session.new), ("update", session.dirty), ("delete", session.deleted)):
+        for obj in objects:
+            if action == "update" and not session.is_modified(obj):
+                continue
+            changes.append((obj.__tablename__, action, _snapshot(obj)))
+
+@event.listens_for(Session, "after_commit")
+def _publish_changes(session):
+    changes = session.info.pop("pending_changes", None)
+    if changes:
+        commit_observer.notify(changes)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changes(session):
+    session.info.pop("pending_changes", None)
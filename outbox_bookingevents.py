@@ -0,0 +1,147 @@
+# outbox_bookingevents.py drains outbox_event rows on a pool of worker threads, handing each event to the booking observer's subscribers with retries
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import delete, update
+from sqlalchemy.orm import joinedload
+from models import db, Booking, OutboxEvent
+from observer_bookingnotifications import booking_observer
+from observer_commitevents import commit_observer
+
+def due_event_ids(limit):
+    return db.session.scalars(
+        db.select(OutboxEvent.id)
+        .where(OutboxEvent.status == "pending", OutboxEvent.available_at <= datetime.utcnow())
+        .order_by(OutboxEvent.available_at, OutboxEvent.id)
+        .limit(limit)
+    ).all()
+
+def _claim(event_id, lease): # Conditional update, of two workers racing for an event only one gets it, and a worker that dies lets it go once the lease runs out
+    now = datetime.utcnow()
+    claimed = db.session.execute(
+        update(OutboxEvent)
+        .where(OutboxEvent.id == event_id, OutboxEvent.status == "pending", OutboxEvent.available_at <= now)
+        .values(attempts=OutboxEvent.attempts + 1, available_at=now + timedelta(seconds=lease))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return claimed == 1
+
+def deliver_event(event_id, config): # Returns "delivered", "retried", "failed", or None when another worker has the event
+    if not _claim(event_id, config["OUTBOX_LEASE"]):
+        return None
+    event = db.session.get(OutboxEvent, event_id)
+    try:
+        bookings = (Booking.query
+                    .options(joinedload(Booking.car)) # the owner notifications need each car
+                    .filter(Booking.id.in_(event.booking_ids))
+                    .order_by(Booking.id)
+                    .all())
+        booking_observer.dispatch(bookings, event.event_type)
+        event.status = "delivered"
+        event.delivered_at = datetime.utcnow()
+        db.session.commit() # whatever the subscribers wrote commits together with the delivered mark
+        return "delivered"
+    except Exception as e:
+        db.session.rollback()
+        event = db.session.get(OutboxEvent, event_id)
+        event.last_error = repr(e)[:500]
+        if event.attempts >= config["OUTBOX_MAX_ATTEMPTS"]:
+            event.status = "failed"
+        else:
+            event.available_at = datetime.utcnow() + timedelta(seconds=config["OUTBOX_RETRY_BACKOFF"] * 2 ** (event.attempts - 1))
+        db.session.commit()
+        return "failed" if event.status == "failed" else "retried"
+
+def purge_delivered_events(retention, batch_size): # Called by the booking sweeper, delivered events are only kept retention seconds for debugging
+    cutoff = datetime.utcnow() - timedelta(seconds=retention)
+    purged = 0
+    while True:
+        delivered = db.select(OutboxEvent.id).where(
+            OutboxEvent.status == "delivered", OutboxEvent.delivered_at < cutoff
+        ).limit(batch_size)
+        count = db.session.execute(
+            delete(OutboxEvent).where(OutboxEvent.id.in_(delivered)).execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        purged += count
+        if count < batch_size:
+            return purged
+
+class OutboxDispatcher: # One scanning thread feeding due events to OUTBOX_WORKERS delivery threads
+    def __init__(self):
+        self._thread = None
+        self._pool = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._start_lock = threading.Lock()
+
+    def _deliver(self, app, event_id): # Pool threads need their own app context, and with it their own session
+        with app.app_context():
+            try:
+                return deliver_event(event_id, app.config)
+            except Exception:
+                db.session.rollback()
+                app.logger.exception("Outbox event %s could not be delivered", event_id)
+                return None
+
+    def drain(self, app, pool=None): # Delivers every event that is due, in batches, on the pool if there is one
+        counts = {"delivered": 0, "retried": 0, "failed": 0}
+        batch_size = app.config["OUTBOX_BATCH_SIZE"]
+        while True:
+            event_ids = due_event_ids(batch_size)
+            db.session.commit() # the scan's read transaction, the deliveries run on their own sessions
+            if not event_ids:
+                break
+            if pool:
+                results = list(pool.map(lambda event_id: self._deliver(app, event_id), event_ids))
+            else:
+                results = [deliver_event(event_id, app.config) for event_id in event_ids]
+            for result in results:
+                if result:
+                    counts[result] += 1
+            if len(event_ids) < batch_size:
+                break
+        return counts
+
+    def start(self, app): # Safe to call from every request, only the first call starts the pool
+        workers = app.config["OUTBOX_WORKERS"]
+        if self._thread or not workers:
+            return
+        with self._start_lock:
+            if self._thread:
+                return
+            self._start(app, workers)
+
+    def _start(self, app, workers):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="outbox-worker")
+        interval = app.config["OUTBOX_POLL_INTERVAL"]
+
+        def run():
+            while not self._stop.is_set():
+                self._wake.clear()
+                with app.app_context():
+                    try:
+                        counts = self.drain(app, self._pool)
+                        if counts["retried"] or counts["failed"]:
+                            app.logger.warning("Outbox delivery: %s", counts)
+                    except Exception:
+                        db.session.rollback()
+                        app.logger.exception("Outbox drain failed")
+                self._wake.wait(interval)
+
+        self._thread = threading.Thread(target=run, name="outbox-dispatcher", daemon=True)
+        self._thread.start()
+
+    def apply_changes(self, changes): # Commit observer callback, a committed event is picked up straight away rather than at the next poll
+        if any(table == "outbox_event" and action == "insert" for table, action, values in changes):
+            self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._pool:
+            self._pool.shutdown(wait=False)
+
+outbox_dispatcher = OutboxDispatcher()
+commit_observer.subscribe(outbox_dispatcher.apply_changes)
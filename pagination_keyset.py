@@ -0,0 +1,64 @@
+# pagination_keyset.py pages through a select() by its sort key instead of OFFSET, so every page costs the same however deep the client scrolls
+import base64
+import json
+from sqlalchemy import tuple_
+from models import db
+
+def parse_limit(raw_limit, default, maximum): # ?limit= with a default and an upper bound, raises ValueError on junk
+    if raw_limit in (None, ""):
+        return default
+    limit = int(raw_limit)
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return min(limit, maximum)
+
+def encode_cursor(tag, values): # Opaque to clients, the tag stops a cursor from one ordering being replayed against another
+    payload = json.dumps([tag, *values], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+def decode_cursor(tag, cursor, size):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(payload, list) or len(payload) != size + 1 or payload[0] != tag:
+        raise ValueError("Invalid cursor")
+    return payload[1:]
+
+def paginate(statement, key_columns, limit, cursor=None, tag="id", descending=False):
+    """Runs one page of statement ordered by key_columns (the last one must be unique, usually the id).
+    Returns (rows, next_cursor); next_cursor is None on the last page."""
+    if cursor:
+        after = decode_cursor(tag, cursor, len(key_columns))
+        key = tuple_(*key_columns)
+        statement = statement.where(key < tuple_(*after) if descending else key > tuple_(*after))
+
+    order = [column.desc() if descending else column.asc() for column in key_columns]
+    keys = [column.label(f"_key{i}") for i, column in enumerate(key_columns)]
+    rows = db.session.execute(statement.add_columns(*keys).order_by(*order).limit(limit + 1)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]._mapping
+        next_cursor = encode_cursor(tag, [last[f"_key{i}"] for i in range(len(key_columns))])
+    return rows, next_cursor
+
+def paginate_union(statements, key_column, limit, cursor=None, tag="id"):
+    """Newest first page over the UNION ALL of statements, an OR split so each half walks its own index.
+    Every statement is cursor filtered and cut at limit + 1 rows before the merge; key_column must be unique and selected by all of them."""
+    after = decode_cursor(tag, cursor, 1)[0] if cursor else None
+    branches = []
+    for statement in statements:
+        if after is not None:
+            statement = statement.where(key_column < after)
+        branches.append(db.select(statement.order_by(key_column.desc()).limit(limit + 1).subquery()))
+    merged = (db.union_all(*branches) if len(branches) > 1 else branches[0]).subquery()
+    rows = db.session.execute(db.select(merged).order_by(merged.c[key_column.key].desc()).limit(limit + 1)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(tag, [getattr(rows[-1], key_column.key)])
+    return rows, next_cursor
@@ -0,0 +1,67 @@
+# pool_passwordhashing.py runs password hashing and checking on a bounded process pool, so a burst of logins can't tie up the threads serving everything else
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from werkzeug.security import generate_password_hash, check_password_hash
+
+class HashPoolBusy(Exception): # Every worker and queue slot is taken, the request should be retried shortly
+    pass
+
+class PasswordHasher:
+    def __init__(self):
+        self.method = "scrypt:32768:8:1"
+        self.workers = 0 # 0 hashes in the calling thread
+        self.timeout = 10
+        self._slots = threading.BoundedSemaphore(1)
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def configure(self, method, workers, queue_depth, timeout):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + queue_depth if workers else 1 + queue_depth) # running plus waiting
+
+    def _executor(self): # Started on first use, spawn keeps the children clear of the parent's threads and sockets
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def _run(self, function, *args):
+        slots = self._slots
+        if not slots.acquire(blocking=False): # fail fast rather than queue without bound
+            raise HashPoolBusy()
+        if not self.workers:
+            try:
+                return function(*args)
+            finally:
+                slots.release()
+        try:
+            future = self._executor().submit(function, *args)
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(lambda done: slots.release()) # the slot is held for as long as the pool has the work, not as long as we wait
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel() # still queued, so drop it, a running hash keeps its slot until it finishes
+            raise HashPoolBusy()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def check(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash): # Werkzeug hashes start with the full method, e.g. scrypt:32768:8:1$salt$hash
+        return password_hash.split("$", 1)[0] != self.method
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,46 @@
+# prefix_locationsuggest.py holds the distinct locations of available cars as a sorted array with listing counts, so autocomplete is a bisect in memory
+import bisect
+import heapq
+import threading
+from sqlalchemy import func
+from models import db, Car
+
+def car_watermark(): # Newest car id and edit, two index lookups, moves with any car insert or update from any process
+    return tuple(db.session.execute(db.select(
+        db.select(func.max(Car.id)).scalar_subquery(),
+        db.select(func.max(Car.updated_at)).scalar_subquery()
+    )).one())
+
+class LocationSuggestIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = [] # lowercased, trimmed locations, sorted
+        self._entries = [] # [display name, available listing count], parallel to _keys
+        self._watermark = None # car_watermark() the arrays were built at, None until the first load
+
+    def rebuild(self, watermark=None): # One grouped query over car
+        if watermark is None:
+            watermark = car_watermark() # read first, so a car committed during the query only costs another rebuild
+        rows = db.session.execute(
+            db.select(func.lower(func.trim(Car.location)), func.max(func.trim(Car.location)), func.count(Car.id))
+            .where(Car.available == True)
+            .group_by(func.lower(func.trim(Car.location)))
+        ).all()
+        rows.sort()
+        with self._lock:
+            self._keys = [key for key, display, count in rows]
+            self._entries = [[display, count] for key, display, count in rows]
+            self._watermark = watermark
+
+    def suggest(self, prefix, limit): # Most listed locations starting with prefix
+        watermark = car_watermark()
+        if watermark != self._watermark: # cars changed, here or in another process (flask import-cars, other workers)
+            self.rebuild(watermark)
+        key = prefix.strip().lower()
+        with self._lock:
+            start = bisect.bisect_left(self._keys, key)
+            end = bisect.bisect_left(self._keys, key + "\uffff", start)
+            best = heapq.nlargest(limit, self._entries[start:end], key=lambda entry: entry[1])
+        return [{"location": display, "count": count} for display, count in best]
+
+location_index = LocationSuggestIndex()
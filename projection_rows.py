@@ -0,0 +1,35 @@
+# projection_rows.py selects only the columns a client asks for (?fields=) with a Core select and serializes rows straight from their mappings, no ORM objects involved
+from models import Car, Booking
+
+CAR_COLUMNS = {column.key: column for column in (
+    Car.id, Car.make, Car.model, Car.year, Car.price_per_day, Car.location, Car.available
+)}
+
+BOOKING_COLUMNS = {column.key: column for column in (
+    Booking.id, Booking.car_id, Booking.user_id, Booking.start_date, Booking.end_date, Booking.status
+)}
+
+def _us_date(value): # Booking.to_dict's date format
+    return value.strftime("%m/%d/%Y")
+
+BOOKING_FORMATTERS = {"start_date": _us_date, "end_date": _us_date}
+
+def pick_columns(raw_fields, columns): # "make,model" -> those columns in that order, every column when empty, ValueError on unknown names
+    names = [name.strip() for name in (raw_fields or "").split(",") if name.strip()]
+    if not names:
+        return list(columns.values())
+    unknown = [name for name in names if name not in columns]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(columns)}")
+    return [columns[name] for name in dict.fromkeys(names)]
+
+def row_serializer(selected, formatters=None): # Returns row -> dict for rows of a select over the selected columns
+    names = [column.key for column in selected]
+    formatters = formatters or {}
+    def serialize(row):
+        mapping = row._mapping
+        return {
+            name: formatters[name](mapping[name]) if name in formatters and mapping[name] is not None else mapping[name]
+            for name in names
+        }
+    return serialize
@@ -0,0 +1,134 @@
+# pubsub_eventstream.py is an in process pub/sub hub that pushes committed messages and booking events to each user's open GET /stream connections as Server-Sent Events
+import itertools
+import queue
+import threading
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import db, User
+from observer_commitevents import commit_observer
+from observer_bookingnotifications import booking_observer
+
+class _Listener: # One open connection
+    def __init__(self, queue_size):
+        self.queue = queue.Queue(queue_size)
+        self.overflowed = False # set when the client stops keeping up, its stream then ends so it reconnects and refetches
+
+class EventHub:
+    def __init__(self, queue_size=100, heartbeat=15):
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self._listeners = {} # user id -> set of _Listener
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def configure(self, queue_size, heartbeat):
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+
+    def listening(self, user_id):
+        return int(user_id) in self._listeners
+
+    def subscribe(self, user_id):
+        listener = _Listener(self.queue_size)
+        with self._lock:
+            self._listeners.setdefault(int(user_id), set()).add(listener)
+        return listener
+
+    def unsubscribe(self, user_id, listener):
+        with self._lock:
+            listeners = self._listeners.get(int(user_id))
+            if listeners is not None:
+                listeners.discard(listener)
+                if not listeners:
+                    del self._listeners[int(user_id)]
+
+    def publish(self, user_id, event_type, data): # Never blocks, a full queue marks that connection overflowed instead
+        with self._lock:
+            listeners = list(self._listeners.get(int(user_id), ()))
+        if not listeners:
+            return
+        item = (next(self._ids), event_type, data)
+        for listener in listeners:
+            try:
+                listener.queue.put_nowait(item)
+            except queue.Full:
+                listener.overflowed = True
+
+    def stream(self, user_id): # text/event-stream response for one user, with a comment line every heartbeat seconds so proxies keep it open
+        dumps = current_app.json.dumps
+        heartbeat = self.heartbeat
+
+        def generate():
+            listener = self.subscribe(user_id) # in here, so a response that is never sent never subscribes
+            try:
+                yield ": connected\n\n"
+                while not listener.overflowed:
+                    try:
+                        event_id, event_type, data = listener.queue.get(timeout=heartbeat)
+                    except queue.Empty:
+                        yield ": heartbeat\n\n"
+                        continue
+                    yield f"id: {event_id}\nevent: {event_type}\ndata: {dumps(data)}\n\n"
+                yield "event: resync\ndata: {}\n\n"
+            finally:
+                self.unsubscribe(user_id, listener)
+
+        return current_app.response_class(
+            generate(),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    def apply_changes(self, changes): # Commit observer callback, every committed message goes to its receiver if they are connected
+        messages = [
+            values for table, action, values in changes
+            if table == "message" and action == "insert" and self.listening(values["receiver_id"])
+        ]
+        if not messages:
+            return
+        with db.engine.connect() as connection: # the committing session is finished with, so the sender emails come over a connection of our own
+            emails = dict(connection.execute(
+                db.select(User.id, User.email).where(User.id.in_({int(values["sender_id"]) for values in messages}))
+            ).all())
+        for values in messages:
+            self.publish(values["receiver_id"], "message", { # the same shape as the inbox rows
+                "id": values["id"],
+                "sender_email": emails.get(int(values["sender_id"])),
+                "content": values["content"],
+                "timestamp": values["timestamp"].isoformat() if values["timestamp"] else None
+            })
+
+event_hub = EventHub()
+commit_observer.subscribe(event_hub.apply_changes)
+
+def _booking_event(booking, message_type):
+    return {
+        "booking_id": booking.id,
+        "car_id": booking.car_id,
+        "event": message_type,
+        "status": booking.status,
+        "start_date": booking.start_date.isoformat(),
+        "end_date": booking.end_date.isoformat()
+    }
+
+def publish_booking_events(bookings, message_type): # Booking observer subscriber, queued on the outbox worker's session and sent to renter and owner once it commits
+    pending = db.session.info.setdefault("stream_events", [])
+    for booking in bookings:
+        data = _booking_event(booking, message_type)
+        pending.append((booking.user_id, data))
+        pending.append((booking.car.owner_id, data))
+
+def publish_booking_event(booking, message_type):
+    publish_booking_events([booking], message_type)
+
+booking_observer.subscribe(publish_booking_event, publish_booking_events)
+
+@event.listens_for(Session, "after_commit")
+def _publish_booking_events(session):
+    for user_id, data in session.info.pop("stream_events", ()):
+        event_hub.publish(user_id, "booking", data)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_booking_events(session): # a retried delivery queues them again
+    session.info.pop("stream_events", None)
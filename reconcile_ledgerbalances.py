@@ -0,0 +1,52 @@
+# reconcile_ledgerbalances.py replays the Payment history since the ledger started onto its opening balances with NumPy and reports every user whose balance_cents drifted
+from models import db, User, Payment, LedgerEntry
+
+def _chunks(statement, id_column, chunk_size): # Keyset chunks of plain int rows, the id comes first, memory stays at one chunk whatever the table size
+    import numpy as np
+    last_id = 0
+    while True:
+        rows = db.session.execute(statement.where(id_column > last_id).order_by(id_column).limit(chunk_size)).all()
+        if not rows:
+            return
+        chunk = np.array(rows, dtype=np.int64)
+        last_id = int(chunk[-1, 0])
+        yield chunk
+        if len(rows) < chunk_size:
+            return
+
+def _sum_by_user(np, user_ids, amounts, size): # Grouped sum of cents per user id, bincount adds in float64 which is exact for any chunk's total
+    return np.rint(np.bincount(user_ids, weights=amounts, minlength=size)).astype(np.int64)
+
+def reconcile_balances(chunk_size, show=20): # Returns counts, the total drift in cents and the largest drifts as (user id, expected, stored)
+    import numpy as np # only this maintenance command needs numpy
+    size = (db.session.scalar(db.select(db.func.max(User.id))) or 0) + 1
+    expected = np.zeros(size, dtype=np.int64)
+    stored = np.zeros(size, dtype=np.int64)
+    exists = np.zeros(size, dtype=bool)
+
+    for chunk in _chunks(db.select(User.id, User.balance_cents), User.id, chunk_size):
+        stored[chunk[:, 0]] = chunk[:, 1]
+        exists[chunk[:, 0]] = True
+    opening = db.select(LedgerEntry.id, LedgerEntry.user_id, LedgerEntry.amount_cents).where(LedgerEntry.kind == "opening")
+    for chunk in _chunks(opening, LedgerEntry.id, chunk_size):
+        expected += _sum_by_user(np, chunk[:, 1], chunk[:, 2], size)
+    payments = 0
+    # Payments from before the ledger are already inside the opening balances, only those the ledger recorded are replayed
+    recorded = db.select(Payment.id, Payment.sender_id, Payment.receiver_id, Payment.amount_cents).where(
+        db.select(LedgerEntry.id).where(LedgerEntry.payment_id == Payment.id).exists()
+    )
+    for chunk in _chunks(recorded, Payment.id, chunk_size):
+        expected -= _sum_by_user(np, chunk[:, 1], chunk[:, 3], size)
+        expected += _sum_by_user(np, chunk[:, 2], chunk[:, 3], size)
+        payments += len(chunk)
+
+    drift = np.where(exists, stored - expected, 0)
+    drifted = np.flatnonzero(drift)
+    worst = drifted[np.argsort(-np.abs(drift[drifted]), kind="stable")[:show]]
+    return {
+        "users": int(exists.sum()),
+        "payments": payments,
+        "drifted": len(drifted),
+        "total_drift_cents": int(np.abs(drift).sum()),
+        "worst": [(int(user_id), int(expected[user_id]), int(stored[user_id])) for user_id in worst]
+    }
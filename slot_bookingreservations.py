@@ -0,0 +1,39 @@
+# slot_bookingreservations.py claims one booking_slot row per car and day for every holding booking, in the booking's own transaction
+# The (car_id, day) primary key lets the database turn away a double booking, with no lock across cars
+from datetime import timedelta
+from sqlalchemy import event, delete, insert
+from sqlalchemy.orm import Session, attributes
+from models import Booking, BookingSlot, ACTIVE_BOOKING_STATUSES
+
+SLOT_FIELDS = ("car_id", "start_date", "end_date", "status")
+
+def booking_days(start_date, end_date): # Inclusive, matching the overlap check
+    return [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+
+def reserve_slots(connection, bookings): # IntegrityError if any day is already held
+    slots = [
+        {"car_id": booking.car_id, "day": day, "booking_id": booking.id}
+        for booking in bookings
+        for day in booking_days(booking.start_date, booking.end_date)
+    ]
+    if slots:
+        connection.execute(insert(BookingSlot), slots)
+
+def release_slots(connection, booking_ids):
+    if booking_ids:
+        connection.execute(delete(BookingSlot).where(BookingSlot.booking_id.in_(booking_ids)))
+
+@event.listens_for(Session, "after_flush")
+def _sync_slots(session, flush_context): # Runs for every flush, so no booking path can skip it
+    connection = session.connection()
+    changed = [
+        booking for booking in session.dirty
+        if isinstance(booking, Booking)
+        and any(attributes.get_history(booking, field).has_changes() for field in SLOT_FIELDS)
+    ]
+    release_slots(connection, [booking.id for booking in changed])
+    release_slots(connection, [booking.id for booking in session.deleted if isinstance(booking, Booking)])
+    reserve_slots(connection, [
+        booking for booking in list(session.new) + changed
+        if isinstance(booking, Booking) and booking.status in ACTIVE_BOOKING_STATUSES
+    ])
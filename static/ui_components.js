@@ -200,6 +200,8 @@ class AuthComponent { // login, registration, logout actions are implemented her
 class CarSearchComponent {
   constructor() {
     this.searchForm = document.getElementById('car-search-form');
+    this.loadMoreButton = document.getElementById('load-more-cars-btn');
+    this.nextCursor = null;
     mediator.registerComponent('carSearch', this);
     this.setupEventListeners();
 
@@ -220,20 +222,35 @@ class CarSearchComponent {
       // Fetch cars using the current search criteria.
       await this.fetchCars();
     });
+    // Follows next_cursor from the last page, keeping the same search
+    this.loadMoreButton.addEventListener('click', () => this.fetchCars(this.nextCursor));
   }
 
-  async fetchCars() {
+  async fetchCars(cursor = null) {
+    const params = new URLSearchParams();
     const locationInput = document.getElementById('location');
-    let query = "";
     if (locationInput && locationInput.value) {
-      query = `?location=${encodeURIComponent(locationInput.value)}`;
+      params.set('location', locationInput.value);
     }
+    // Only cars that are free for the chosen dates
+    const startInput = document.getElementById('start_date');
+    const endInput = document.getElementById('end_date');
+    if (startInput && endInput && startInput.value && endInput.value) {
+      params.set('start_date', startInput.value);
+      params.set('end_date', endInput.value);
+    }
+    if (cursor) {
+      params.set('cursor', cursor);
+    }
+    const query = params.toString() ? `?${params}` : "";
     try {
       const response = await fetch(`/cars${query}`);
       if (response.ok) {
-        const cars = await response.json();
+        const { cars, next_cursor } = await response.json();
         console.log("Fetched cars:", cars);
-        this.displayResults(cars);
+        this.displayResults(cars, Boolean(cursor));
+        this.nextCursor = next_cursor;
+        this.loadMoreButton.style.display = next_cursor ? 'block' : 'none';
       } else {
         console.error("Failed to fetch cars", response.status);
       }
@@ -242,9 +259,11 @@ class CarSearchComponent {
     }
   }
 
-  displayResults(cars) {
+  displayResults(cars, append = false) {
     const resultsContainer = document.getElementById('search-results');
-    resultsContainer.innerHTML = '';
+    if (!append) {
+      resultsContainer.innerHTML = '';
+    }
     cars.forEach(car => {
       const carElement = document.createElement('div');
       carElement.className = 'car-item';
@@ -254,13 +273,12 @@ class CarSearchComponent {
         <p>Location: ${car.location}</p>
         <button class="book-now-btn" data-car-id="${car.id}">Book Now</button>
       `;
-      resultsContainer.appendChild(carElement);
-    });
-    document.querySelectorAll('.book-now-btn').forEach(btn => {
-      btn.addEventListener('click', (e) => {
+      // Bound per card, so appending a page doesn't stack listeners on the earlier ones
+      carElement.querySelector('.book-now-btn').addEventListener('click', (e) => {
         const carId = e.target.getAttribute('data-car-id');
         mediator.notify('bookingRequested', { carId });
       });
+      resultsContainer.appendChild(carElement);
     });
   }
 }
@@ -339,7 +357,7 @@ class MyBookingsComponent {
   async fetchMyBookings() {
     try {
       const token = localStorage.getItem('token');
-      const response = await fetch('/mybookings', {
+      const response = await fetch('/mybookings?include=car', {
         headers: {
           'Authorization': `Bearer ${token}`
         }
@@ -367,9 +385,10 @@ class MyBookingsComponent {
       bookingEl.classList.add('booking-card');
       bookingEl.innerHTML = `
         <h3>Booking #${booking.id}</h3>
-        <p>Car ID: ${booking.car_id}</p>
+        <p>Car: ${booking.car.make} ${booking.car.model} (${booking.car.year})</p>
         <p>Start: ${booking.start_date}</p>
         <p>End: ${booking.end_date}</p>
+        <p>Total: $${booking.total_price}</p>
       `;
       this.bookingsList.appendChild(bookingEl);
     });
@@ -591,12 +610,26 @@ class MessagingComponent {
 class InboxComponent {
     constructor() {
         this.inboxList = document.getElementById('inbox-messages');
+        this.loadOlderButton = document.getElementById('load-older-messages-btn');
         mediator.registerComponent('inbox', this);
         
         this.currentUserId = null;
+        this.messages = [];
+        this.eventSource = null;
+        this.pageSize = 50; // the endpoint only returns the newest page, older ones are fetched with before_id
+        
+        this.loadOlderButton.addEventListener('click', () => {
+            const oldest = this.messages[this.messages.length - 1];
+            if (oldest) this.fetchInboxMessages(oldest.id);
+        });
         
         mediator.on('userInfoLoaded', (userInfo) => {
             this.currentUserId = userInfo.id;
+            this.openStream();
+        });
+        
+        mediator.on('userLoggedOut', () => {
+            this.closeStream();
         });
         
         mediator.on('tabChanged', (tabName) => {
@@ -606,14 +639,43 @@ class InboxComponent {
         });
     }
     
-    async fetchInboxMessages() {
+    openStream() { // One EventSource pushes new messages and booking updates, the inbox is only fetched in full once
+        this.closeStream();
+        const token = localStorage.getItem('token');
+        if (!token) return;
+        this.eventSource = new EventSource(`/stream?jwt=${encodeURIComponent(token)}`);
+        this.eventSource.addEventListener('message', (event) => {
+            this.messages.unshift(JSON.parse(event.data));
+            this.displayMessages(this.messages);
+        });
+        this.eventSource.addEventListener('booking', (event) => {
+            const booking = JSON.parse(event.data);
+            mediator.notify('notification', 'success', `Booking #${booking.booking_id} ${booking.event}`);
+        });
+        this.eventSource.addEventListener('resync', () => { // the server dropped events for us, so refetch once it reconnects
+            this.fetchInboxMessages();
+        });
+    }
+    
+    closeStream() {
+        if (this.eventSource) {
+            this.eventSource.close();
+            this.eventSource = null;
+        }
+    }
+    
+    async fetchInboxMessages(beforeId = null) { // Newest page, or with beforeId the page of messages older than it
         if (!this.currentUserId) {
             console.warn("No current user ID; can't fetch messages yet.");
             return;
         }
+        const params = new URLSearchParams({ limit: this.pageSize });
+        if (beforeId) {
+            params.set('before_id', beforeId);
+        }
         try {
             const token = localStorage.getItem('token');
-            const response = await fetch(`/users/${this.currentUserId}/messages`, {
+            const response = await fetch(`/users/${this.currentUserId}/messages?${params}`, {
             headers: {
                 'Authorization': `Bearer ${token}`
             }
@@ -621,7 +683,9 @@ class InboxComponent {
             if (response.ok) {
                 const messages = await response.json();
                 console.log("Fetched my inbound messages:", messages);
-                this.displayMessages(messages);
+                this.messages = beforeId ? this.messages.concat(messages) : messages;
+                this.displayMessages(this.messages);
+                this.loadOlderButton.style.display = messages.length === this.pageSize ? 'block' : 'none';
             } else {
                 console.error("Failed to fetch messages:", response.status);
             }
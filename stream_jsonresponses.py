@@ -0,0 +1,66 @@
+# stream_jsonresponses.py sends large result sets as they are read from the database, as a JSON array, NDJSON or CSV, so memory per worker stays flat
+import csv
+import io
+from flask import current_app, request, stream_with_context
+from models import db
+
+NDJSON = "application/x-ndjson"
+
+def wants_ndjson():
+    return request.accept_mimetypes.best == NDJSON
+
+def wants_stream(): # ?stream=1, or asking for NDJSON at all
+    return request.args.get("stream", "").lower() in ("1", "true") or wants_ndjson()
+
+def stream_rows(statement, serialize): # Response that runs statement in batches and writes each row out as soon as it is read
+    batch_size = current_app.config["STREAM_BATCH_SIZE"]
+    dumps = current_app.json.dumps # same encoding as jsonify
+    ndjson = wants_ndjson()
+
+    def generate():
+        result = db.session.execute(statement.execution_options(stream_results=True, yield_per=batch_size))
+        try:
+            if ndjson:
+                for row in result:
+                    yield dumps(serialize(row)) + "\n"
+                return
+            yield "["
+            separator = ""
+            for row in result:
+                yield separator + dumps(serialize(row))
+                separator = ","
+            yield "]"
+        finally:
+            result.close()
+
+    return current_app.response_class(
+        stream_with_context(generate()),
+        mimetype=NDJSON if ndjson else "application/json"
+    )
+
+def stream_csv(statement, header, to_row, filename): # CSV download written a row at a time from the same batched cursor
+    batch_size = current_app.config["STREAM_BATCH_SIZE"]
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        def flush():
+            data = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return data
+
+        writer.writerow(header)
+        yield flush()
+        result = db.session.execute(statement.execution_options(stream_results=True, yield_per=batch_size))
+        try:
+            for row in result:
+                writer.writerow(to_row(row))
+                yield flush()
+        finally:
+            result.close()
+
+    response = current_app.response_class(stream_with_context(generate()), mimetype="text/csv")
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    return response
@@ -0,0 +1,90 @@
+# sweeper_pendingbookings.py expires pending bookings that outlived the hold TTL, releasing their days and telling the owner, and purges expired idempotency keys and delivered outbox events, from a background thread
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy.orm import joinedload
+from models import db, Booking, Payment
+from observer_bookingnotifications import booking_observer
+from idempotency_requestreplay import purge_expired_keys
+from outbox_bookingevents import purge_delivered_events
+
+def sweep_expired_bookings(hold_ttl, batch_size): # Returns how many bookings were expired
+    cutoff = datetime.utcnow() - timedelta(seconds=hold_ttl)
+    unpaid = ~db.select(Payment.id).where(Payment.booking_id == Booking.id).exists() # paid before payments confirmed bookings
+    swept = 0
+    while True:
+        bookings = (Booking.query
+                    .options(joinedload(Booking.car)) # the owner notifications need each car
+                    .filter(Booking.status == "pending", Booking.created_at < cutoff, unpaid)
+                    .order_by(Booking.created_at)
+                    .limit(batch_size)
+                    .all())
+        if not bookings:
+            break
+        # The candidates were read without a lock, so re-check them in the write itself, a /pay committing in between keeps its booking
+        claimed = set(db.session.scalars(
+            db.update(Booking)
+            .where(Booking.id.in_([booking.id for booking in bookings]), Booking.status == "pending", unpaid)
+            .values(status="expired")
+            .returning(Booking.id)
+            .execution_options(synchronize_session=False)
+        ))
+        expired = [booking for booking in bookings if booking.id in claimed]
+        for booking in expired:
+            booking.status = "expired" # already written above, this lets the booking_slot flush hook free the days and the commit observer see it
+        if expired:
+            booking_observer.notify_many(expired, "expired")
+        db.session.commit()
+        swept += len(expired)
+        if len(bookings) < batch_size:
+            break
+    return swept
+
+class BookingSweeper: # Runs sweep_expired_bookings every BOOKING_SWEEP_INTERVAL seconds
+    def __init__(self):
+        self._thread = None
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        self.last_run = None
+        self.last_swept = 0
+        self.total_swept = 0
+
+    def run_once(self, app):
+        swept = sweep_expired_bookings(app.config["BOOKING_HOLD_TTL"], app.config["BOOKING_SWEEP_BATCH"])
+        purged = purge_expired_keys(app.config["BOOKING_SWEEP_BATCH"])
+        delivered = purge_delivered_events(app.config["OUTBOX_RETENTION"], app.config["BOOKING_SWEEP_BATCH"])
+        self.last_run = datetime.utcnow()
+        self.last_swept = swept
+        self.total_swept += swept
+        app.logger.info(
+            "Booking sweeper expired %d pending bookings, purged %d idempotency keys and %d delivered outbox events",
+            swept, purged, delivered
+        )
+        return swept
+
+    def start(self, app): # Safe to call from every request, only the first call starts the thread
+        interval = app.config["BOOKING_SWEEP_INTERVAL"]
+        if self._thread or not interval:
+            return
+        with self._start_lock:
+            if self._thread:
+                return
+            self._start(app, interval)
+
+    def _start(self, app, interval):
+
+        def run():
+            while not self._stop.wait(interval):
+                with app.app_context():
+                    try:
+                        self.run_once(app)
+                    except Exception:
+                        db.session.rollback()
+                        app.logger.exception("Booking sweep failed")
+
+        self._thread = threading.Thread(target=run, name="booking-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+booking_sweeper = BookingSweeper()